@@ -180,6 +180,11 @@ def rebuild_subtheme_summary() -> None:
 
     SUBS_CSV.parent.mkdir(parents=True, exist_ok=True)
     out.to_csv(SUBS_CSV, index=False, encoding="utf-8")
+    # Typed Parquet sidecar for the next pipeline steps; subthemes.csv stays the contract.
+    try:
+        out.to_parquet(SUBS_CSV.with_suffix(".parquet"), index=False, compression="zstd")
+    except Exception as e:
+        print("[warn] subthemes.parquet not written:", e)
     print(f"Summary updated → {SUBS_CSV} ({len(out)} rows)")
 
 # ---- input loader ----
@@ -192,13 +197,18 @@ def load_input_df(path_obj: Path) -> pd.DataFrame:
       - Else, try Title + Content / selftext / body and join them.
     """
     df = None
+    # Prefer the multi-threaded pyarrow parser; fall back to the default C engine
+    # (e.g. pyarrow not installed or a file it cannot parse).
     try:
-        df = pd.read_csv(path_obj, encoding="utf-8-sig", dtype=str)
+        df = pd.read_csv(path_obj, encoding="utf-8-sig", dtype=str, engine="pyarrow")
     except Exception:
         try:
-            df = pd.read_csv(path_obj, dtype=str)
-        except Exception as e:
-            raise RuntimeError("Cannot read input: " + str(e))
+            df = pd.read_csv(path_obj, encoding="utf-8-sig", dtype=str)
+        except Exception:
+            try:
+                df = pd.read_csv(path_obj, dtype=str)
+            except Exception as e:
+                raise RuntimeError("Cannot read input: " + str(e))
 
     if df is None:
         raise RuntimeError("Empty input")
@@ -211,7 +221,7 @@ def load_input_df(path_obj: Path) -> pd.DataFrame:
     if "text" in cols_lower:
         col_text = cols_lower["text"]
         df["text"] = df[col_text].fillna("").astype(str)
-        return df[["text"]].copy()
+        return df[["text"]]  # column selection already returns a new frame
 
     # Case 2: Title + Content-style columns
     title_col = None
@@ -264,8 +274,14 @@ def ensure_out_csv_has_ids(path_obj: Path) -> None:
         df_old.to_csv(path_obj, index=False, encoding="utf-8-sig")
 
 # ---- main entry ----
-def main() -> None:
-    """Main entry: run subthemes extraction and update both output CSVs."""
+def main(argv: list[str] | None = None) -> None:
+    """Main entry: run subthemes extraction and update both output CSVs.
+
+    argv: optional [input_csv]; when given it overrides CSV_IN (used by pipeline.py).
+    """
+    global CSV_IN
+    if argv:
+        CSV_IN = Path(argv[0])
     if CSV_IN is None:
         return
 
@@ -145,13 +145,14 @@ def process_row(row, member_map, rep_to_dim):
     row["subs_evidences"] = json.dumps(new_evi, ensure_ascii=False)
     return row
 
-def main():
-    if len(sys.argv) < 3:
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if len(argv) < 2:
         print("Usage: python mapping_sub2dim.py <comments.csv> <dimension_clusters.json>")
         sys.exit(1)
 
-    csv_path = Path(sys.argv[1])
-    json_path = Path(sys.argv[2])
+    csv_path = Path(argv[0])
+    json_path = Path(argv[1])
 
     if not csv_path.exists():
         print(f"[fatal] CSV not found: {csv_path}")
@@ -2,8 +2,12 @@ import csv
 import hashlib
 import json
 import re
+import sqlite3
+import threading
+import numpy as np
 import pandas as pd
 from functools import lru_cache
+from scipy import sparse
 from pathlib import Path
 from flask import abort
 from werkzeug.security import check_password_hash, generate_password_hash
@@ -35,6 +39,7 @@ def _load_mapping():
       by_dim: { dimName: [{name, file}, ...] }
       file_of_sub: { subthemeName: mapped_file }
       dims_of_sub: { subthemeName: [dims...] }
+      subs_of_dim: by_dim deduped by subtheme name (first entry wins)
     """
     by_dim, file_of_sub, dims_of_sub = {}, {}, {}
 
@@ -42,7 +47,7 @@ def _load_mapping():
     print(">> MAP CSV:", SR_MAP_CSV, SR_MAP_CSV.exists())
 
     if not SR_MAP_CSV.exists():
-        return {"by_dim": by_dim, "file_of_sub": file_of_sub, "dims_of_sub": dims_of_sub}
+        return {"by_dim": by_dim, "file_of_sub": file_of_sub, "dims_of_sub": dims_of_sub, "subs_of_dim": {}}
 
     with SR_MAP_CSV.open("r", encoding="utf-8-sig", newline="") as f:
         reader = csv.DictReader(f)
@@ -62,7 +67,14 @@ def _load_mapping():
             dims_of_sub[sub] = dim_list or dims_of_sub.get(sub, [])
             for d in dim_list:
                 by_dim.setdefault(d, []).append({"name": sub, "file": fil})
-    return {"by_dim": by_dim, "file_of_sub": file_of_sub, "dims_of_sub": dims_of_sub}
+
+    subs_of_dim = {}
+    for d, subs in by_dim.items():
+        first = {}
+        for s in subs:
+            first.setdefault(s["name"], s)
+        subs_of_dim[d] = list(first.values())
+    return {"by_dim": by_dim, "file_of_sub": file_of_sub, "dims_of_sub": dims_of_sub, "subs_of_dim": subs_of_dim}
 
 def _read_mapping_exploded(primary_csv: Path, fallback_csv: Path | None = None) -> pd.DataFrame:
     """
@@ -104,7 +116,154 @@ def _read_mapping_exploded(primary_csv: Path, fallback_csv: Path | None = None)
     return pd.DataFrame(out_rows)
 
 # ---------- Posts / Comments loaders ----------
+# The posts snapshot (frame plus the indexes built over it) is built once and reused until
+# news_data.db changes on disk. A rebuild swaps in a whole new dict with one assignment, so a
+# request holding a snapshot never mixes one frame's rows with another frame's indexes.
+# Callers must treat it as read-only.
+_POSTS_SNAPSHOT = None
+
+# Codes stored in the post x subtheme sentiment matrix (absent entries are 0)
+SENT_CODES = {"positive": 1, "negative": -1}
+SENT_OTHER = 2
+
+def load_posts_snapshot() -> dict:
+    """
+    Current posts snapshot:
+      df: posts frame (index is 0..n-1)
+      dim_masks: { dimension: boolean row mask }
+      sent_vocab / sent_mat: subtheme -> column, post x subtheme sentiment CSR
+      ym_order / ym_sorted: year-month sort index for the period filter
+      fts: text search index (built on first use)
+    """
+    global _POSTS_SNAPSHOT
+    snap = _POSTS_SNAPSHOT
+    mtime = NEWS_DB.stat().st_mtime if NEWS_DB.exists() else None
+    if snap is not None and snap["mtime"] == mtime:
+        return snap
+    df = _build_posts()
+    vocab, mat = _build_sentiment_matrix(df)
+    ym_order, ym_sorted = _build_ym_index(df)
+    snap = {"mtime": mtime, "df": df, "dim_masks": _build_dim_masks(df), "sent_vocab": vocab, "sent_mat": mat,
+            "ym_order": ym_order, "ym_sorted": ym_sorted, "fts": None}
+    _POSTS_SNAPSHOT = snap
+    return snap
+
 def load_posts() -> pd.DataFrame:
+    return load_posts_snapshot()["df"]
+
+def _build_dim_masks(df: pd.DataFrame) -> dict:
+    # dimension -> boolean row mask over the snapshot frame (index is 0..n-1)
+    ex = df["dimensions"].explode().dropna()
+    masks = {}
+    for d, rows in ex.groupby(ex, sort=False).groups.items():
+        m = np.zeros(len(df), dtype=bool)
+        m[rows.to_numpy()] = True
+        masks[d] = m
+    return masks
+
+def dimension_mask(snap: dict, posts: pd.DataFrame, dim: str) -> np.ndarray:
+    """Rows of `posts` (the snapshot frame or a filtered slice of it) tagged with `dim`."""
+    m = snap["dim_masks"].get(dim)
+    if m is None:
+        return np.zeros(len(posts), dtype=bool)
+    return m[posts.index.to_numpy()]
+
+def _build_ym_index(df: pd.DataFrame):
+    # year*100 + month per row (unknown year -> -1), plus the stable order that sorts it
+    ym = df["_y"].fillna(-1).to_numpy(dtype=np.int64) * 100 + df["_m"].fillna(0).to_numpy(dtype=np.int64)
+    order = np.argsort(ym, kind="stable")
+    return order, ym[order]
+
+def period_filter(snap: dict, posts: pd.DataFrame, y=None, m=None) -> pd.DataFrame:
+    """Rows of `posts` in year `y` and/or month `m` (falsy = no filter), order preserved."""
+    if not y:
+        return posts[posts["_m"] == m] if m else posts
+    lo_key, hi_key = (y * 100 + m, y * 100 + m + 1) if m else (y * 100, y * 100 + 100)
+    lo, hi = np.searchsorted(snap["ym_sorted"], [lo_key, hi_key])
+    rows = np.sort(snap["ym_order"][lo:hi])
+    if len(posts) == len(snap["df"]):
+        return posts.iloc[rows]
+    keep = np.zeros(len(snap["df"]), dtype=bool)
+    keep[rows] = True
+    return posts[keep[posts.index.to_numpy()]]
+
+def _build_sentiment_matrix(df: pd.DataFrame):
+    # subs_sentiment dicts -> sparse int8 matrix (post row x subtheme column)
+    vocab, rows, cols, vals = {}, [], [], []
+    for i, ss in enumerate(df["subs_sentiment"]):
+        if type(ss) is not dict:
+            continue
+        for k, v in ss.items():
+            rows.append(i)
+            cols.append(vocab.setdefault(k, len(vocab)))
+            vals.append(SENT_CODES.get(str(v).lower().strip(), SENT_OTHER))
+    mat = sparse.csr_matrix(
+        (np.asarray(vals, dtype=np.int8), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+        shape=(len(df), len(vocab)), dtype=np.int8,
+    )
+    return vocab, mat
+
+def sentiment_matrix(snap: dict, posts: pd.DataFrame):
+    """(subtheme -> column, CSR rows for `posts`) from the snapshot's sentiment matrix."""
+    return snap["sent_vocab"], snap["sent_mat"][posts.index.to_numpy()]
+
+# ---------- Text search ----------
+# Columns matched by /api/posts?q= (lowercased copies built in _build_posts)
+SEARCH_COLS = ["title_lc", "content_lc", "author_lc", "source_lc", "dimensions_lc"]
+FTS_MIN_QUERY = 3  # trigram index needs at least 3 characters
+_FTS_LOCK = threading.Lock()
+
+def _build_fts(df: pd.DataFrame):
+    # In-memory SQLite FTS5 trigram index over the search columns; rowid = row of the snapshot frame.
+    try:
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        conn.execute(f"CREATE VIRTUAL TABLE posts_fts USING fts5({', '.join(SEARCH_COLS)}, tokenize='trigram')")
+        rows = df[SEARCH_COLS].astype(object).where(df[SEARCH_COLS].notna(), "")
+        conn.executemany(
+            f"INSERT INTO posts_fts(rowid, {', '.join(SEARCH_COLS)}) VALUES (?{', ?' * len(SEARCH_COLS)})",
+            ((i, *vals) for i, vals in enumerate(rows.itertuples(index=False, name=None))),
+        )
+        conn.commit()
+        return conn
+    except sqlite3.Error as e:
+        print("!! FTS5 index unavailable, falling back to scans:", e)
+        return False
+
+def _fts_rows(snap: dict, q: str):
+    """Candidate rows of the snapshot frame for `q`, or None when the index cannot be used."""
+    if len(q) < FTS_MIN_QUERY:
+        return None
+    with _FTS_LOCK:
+        if snap["fts"] is None:
+            snap["fts"] = _build_fts(snap["df"])
+        conn = snap["fts"]
+        if not conn:
+            return None
+        phrase = '"' + q.replace('"', '""') + '"'
+        cur = conn.execute("SELECT rowid FROM posts_fts WHERE posts_fts MATCH ?", (phrase,))
+        return np.fromiter((r[0] for r in cur), dtype=np.int64)
+
+def text_search_mask(snap: dict, posts: pd.DataFrame, q: str) -> np.ndarray:
+    """Rows of `posts` whose title/content/author/source/dimensions contain `q` (lowercase)."""
+    full = snap["df"]
+    rows = _fts_rows(snap, q)
+    cand = full if rows is None else full.iloc[rows]
+    # exact substring check on the candidates (the index only narrows them down)
+    hit = np.zeros(len(cand), dtype=bool)
+    for c in SEARCH_COLS:
+        hit |= cand[c].str.contains(q, na=False, regex=False).to_numpy(dtype=bool)
+    m = np.zeros(len(full), dtype=bool)
+    m[cand.index.to_numpy()[hit]] = True
+    return m[posts.index.to_numpy()]
+
+def _lower_str(s: pd.Series) -> pd.Series:
+    # Arrow-backed strings make the substring search noticeably faster when pyarrow is around
+    try:
+        return s.astype("string[pyarrow]").str.lower()
+    except (ImportError, TypeError):
+        return s.str.lower()
+
+def _build_posts() -> pd.DataFrame:
     sql = """
         SELECT tag, text, author, score, comment_count, content, created_time,
                dimensions, subthemes, subs_sentiment, source
@@ -148,7 +307,30 @@ def load_posts() -> pd.DataFrame:
     except Exception:
         pass
 
-    return out.drop(columns=["time_raw", "dimensions_raw", "subthemes_raw", "subs_sentiment_raw"])
+    # Year / month parsed once for the year/month filters
+    ymd = pd.to_datetime(out["time"], errors="coerce", utc=False, format="mixed")
+    out["_y"] = ymd.dt.year.astype("Int16")
+    out["_m"] = ymd.dt.month.astype("Int8")
+
+    # Lowercased copies for the /api/posts text search
+    for c in ("title", "content", "author", "source"):
+        out[c + "_lc"] = _lower_str(out[c])
+    out["dimensions_lc"] = _lower_str(out["dimensions"].map(lambda arr: "\x1f".join(arr)))
+
+    out = out.drop(columns=["time_raw", "dimensions_raw", "subthemes_raw", "subs_sentiment_raw"])
+    return out.reset_index(drop=True)
+
+# Tag -> comment count over the whole reddit table, rebuilt when reddit_data.db changes
+_COMMENT_COUNTS_CACHE = {"mtime": None, "counts": None}
+
+def load_comment_counts() -> dict:
+    mtime = REDDIT_DB.stat().st_mtime if REDDIT_DB.exists() else None
+    if _COMMENT_COUNTS_CACHE["counts"] is not None and _COMMENT_COUNTS_CACHE["mtime"] == mtime:
+        return _COMMENT_COUNTS_CACHE["counts"]
+    cdf = _read_sql(REDDIT_DB, "SELECT Tag, COUNT(1) AS cnt FROM reddit GROUP BY Tag")
+    counts = dict(zip(cdf["Tag"].astype(str), cdf["cnt"].astype(int)))
+    _COMMENT_COUNTS_CACHE.update(mtime=mtime, counts=counts)
+    return counts
 
 def load_comments_by_tag(tag: str) -> pd.DataFrame:
     sql = """
@@ -239,7 +421,27 @@ def load_sbi_info(year: int, month: int | None):
     return {"year": int(year), "months_with_data": months_with_data, "sbi": cur_sbi, "delta": delta}
 
 # ---------- Users ----------
+# Parsed users.csv, reused until the file's mtime changes (api_register updates it in place).
+_USERS_CACHE = {"mtime": None, "data": None}
+
 def _load_users():
+    mtime = USERS_CSV.stat().st_mtime if USERS_CSV.exists() else None
+    if _USERS_CACHE["data"] is not None and _USERS_CACHE["mtime"] == mtime:
+        return _USERS_CACHE["data"]
+    users = _read_users()
+    _USERS_CACHE.update(mtime=mtime, data=users)
+    return users
+
+def _remember_user(user: dict):
+    """Add a user just appended to USERS_CSV to the cache without re-reading the file."""
+    if _USERS_CACHE["data"] is None or _USERS_CACHE["mtime"] is None:
+        # the file did not exist before (default admin only); read it fresh next time
+        _USERS_CACHE["data"] = None
+        return
+    _USERS_CACHE["data"][user["email"]] = user
+    _USERS_CACHE["mtime"] = USERS_CSV.stat().st_mtime
+
+def _read_users():
     users = {}
     if USERS_CSV.exists():
         df = _read_csv_safe(USERS_CSV)
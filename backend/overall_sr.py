@@ -6,6 +6,8 @@
 #   - Computes overall sentiment counts and average confidence
 #   - Derives dataset metadata: time coverage, sources, counts
 #   - Sends a single prompt to DeepSeek to produce an overall executive-level JSON report
+#     (static instructions as the system message, run statistics as the user message;
+#      the model answers in compact short-key JSON, expanded locally via expand_keys)
 #   - Injects dataset_metadata into the final JSON
 #
 # Usage:
@@ -13,6 +15,8 @@
 #   python overall_sr.py --csv comments.csv --out overall_summary.json --model deepseek/deepseek-chat-v3.1:free --title "Corporate Culture — Overall Summary"
 
 import json
+import time
+import random
 import argparse
 from pathlib import Path
 import pandas as pd
@@ -28,11 +32,101 @@ from subthe_dimen_sr import (
 )
 
 
-def build_overall_prompt(report_title: str,
-                         global_stats: dict,
+# Static part of the overall prompt: role, task and output schema.
+# It is byte-identical across runs, so it is sent first as the system message
+# and providers can reuse the cached prefix.
+# The schema uses short keys and minified JSON to keep the output small;
+# SHORT_KEYS maps them back to the documented field names.
+_STATIC_PREFIX = """
+You are a senior corporate culture and ESG advisor.
+You will receive high-level statistics about an organisation's culture-related discourse
+and must write a single executive-level summary and recommendation pack.
+
+TASK
+====
+
+Write a concise overall report in JSON form, targeting a senior executive audience
+(e.g., Group CEO, Board, Chief People Officer). The report should:
+
+1. Summarise the overall sentiment and main storylines.
+2. Highlight 3–5 key insights that matter most for leadership.
+3. Clearly state whether overall sentiment is predominantly "positive" or "negative".
+4. Identify 3–5 key risks and 3–5 key opportunities.
+5. Provide 3–5 actionable recommendations with explicit ownership and expected impact.
+6. Include a brief note on limitations / next steps.
+
+The statistics are given in the CONTEXT block of the user message. Do not fabricate numbers.
+
+OUTPUT FORMAT
+=============
+
+Return STRICT minified JSON ONLY (no indentation, no line breaks, no code fences), using these short keys:
+s=section, eb=executive_briefing, t=title, ki=key_insights, sc=sentiment_and_confidence,
+os=overall_sentiment, su=summary, ro=risks_and_opportunities, r=risks, o=opportunities,
+nm=name, d=description, ar=actionable_recommendations, rec=recommendation, ow=ownership,
+im=impact, nt=note.
+
+{"s":{"eb":{"t":"<short title>","ki":["<insight1>","<insight2>","<insight3>","<insight4>"],"sc":{"os":"<positive|negative>","su":"<2–3 sentence explanation>"},"ro":{"r":[{"nm":"<risk name>","d":"<1–2 sentences>"},{"nm":"<risk name>","d":"<1–2 sentences>"}],"o":[{"nm":"<opportunity name>","d":"<1–2 sentences>"},{"nm":"<opportunity name>","d":"<1–2 sentences>"}]},"ar":[{"rec":"<action>","ow":"<team>","im":"<impact>"},{"rec":"<action>","ow":"<team>","im":"<impact>"},{"rec":"<action>","ow":"<team>","im":"<impact>"}],"nt":"<brief limitations>"}}}
+""".strip()
+
+# Short output keys -> documented report field names.
+SHORT_KEYS = {
+    "s": "section",
+    "eb": "executive_briefing",
+    "t": "title",
+    "ki": "key_insights",
+    "sc": "sentiment_and_confidence",
+    "os": "overall_sentiment",
+    "su": "summary",
+    "ro": "risks_and_opportunities",
+    "r": "risks",
+    "o": "opportunities",
+    "nm": "name",
+    "d": "description",
+    "ar": "actionable_recommendations",
+    "rec": "recommendation",
+    "ow": "ownership",
+    "im": "impact",
+    "nt": "note",
+}
+
+
+def expand_keys(obj, mapping: dict = SHORT_KEYS):
+    # Recursively rename short keys back to full field names.
+    # Keys that are already full names (or unknown) are kept as-is.
+    if isinstance(obj, dict):
+        return {mapping.get(k, k): expand_keys(v, mapping) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [expand_keys(v, mapping) for v in obj]
+    return obj
+
+
+# Dynamic part of the overall prompt: the dataset statistics for this run.
+_DYNAMIC_SUFFIX = """
+CONTEXT
+=======
+
+Overall dataset:
+- Total raw rows (comments/news/posts): {total_rows}
+- Total labelled mentions (subtheme-level): {total_mentions}
+- Overall sentiment counts (subtheme-level, neutral removed):
+- positive: {pos}
+- negative: {neg}
+- Average confidence (weighted by mentions): {avg_conf:.3f}
+
+Top dimensions (by mentions):
+{dim_block}
+
+Top subthemes (by mentions):
+{sub_block}
+"""
+
+
+def build_overall_prompt(global_stats: dict,
                          top_dimensions: list,
-                         top_subthemes: list) -> str:
-    # Build the DeepSeek prompt for a single overall report.
+                         top_subthemes: list) -> list:
+    # Build the DeepSeek messages for a single overall report:
+    # static instructions first (system), run-specific statistics last (user).
     pos = global_stats["sentiment_counts"].get("positive", 0)
     neg = global_stats["sentiment_counts"].get("negative", 0)
     avg_conf = global_stats["average_confidence"]
@@ -55,111 +149,21 @@ def build_overall_prompt(report_title: str,
         )
     sub_block = "\n".join(sub_lines) if sub_lines else "(no subtheme stats)"
 
-    prompt = f"""
-You are a senior corporate culture and ESG advisor.
-You will receive high-level statistics about an organisation's culture-related discourse
-and must write a single executive-level summary and recommendation pack.
+    system = _STATIC_PREFIX
+    user = _DYNAMIC_SUFFIX.format(
+        total_rows=global_stats["total_rows"],
+        total_mentions=global_stats["total_mentions"],
+        pos=pos,
+        neg=neg,
+        avg_conf=avg_conf,
+        dim_block=dim_block,
+        sub_block=sub_block,
+    ).strip()
 
-CONTEXT
-=======
-
-Overall dataset:
-- Total raw rows (comments/news/posts): {global_stats["total_rows"]}
-- Total labelled mentions (subtheme-level): {global_stats["total_mentions"]}
-- Overall sentiment counts (subtheme-level, neutral removed):
-- positive: {pos}
-- negative: {neg}
-- Average confidence (weighted by mentions): {avg_conf:.3f}
-
-Top dimensions (by mentions):
-{dim_block}
-
-Top subthemes (by mentions):
-{sub_block}
-
-TASK
-====
-
-Write a concise overall report in JSON form, targeting a senior executive audience
-(e.g., Group CEO, Board, Chief People Officer). The report should:
-
-1. Summarise the overall sentiment and main storylines.
-2. Highlight 3–5 key insights that matter most for leadership.
-3. Clearly state whether overall sentiment is predominantly "positive" or "negative".
-4. Identify 3–5 key risks and 3–5 key opportunities.
-5. Provide 3–5 actionable recommendations with explicit ownership and expected impact.
-6. Include a brief note on limitations / next steps.
-
-OUTPUT FORMAT
-=============
-
-Return STRICT JSON ONLY:
-
-{{
-"report_title": "{report_title}",
-"section": {{
-    "executive_briefing": {{
-    "title": "<short title>",
-    "key_insights": [
-        "<insight1>",
-        "<insight2>",
-        "<insight3>",
-        "<insight4>"
-    ],
-    "sentiment_and_confidence": {{
-        "overall_sentiment": "<positive|negative>",
-        "summary": "<2–3 sentence explanation>",
-        "counts": {{
-            "positive": {pos},
-            "negative": {neg}
-        }},
-        "average_confidence": {avg_conf:.3f}
-    }},
-    "risks_and_opportunities": {{
-        "risks": [
-            {{
-                "name": "<risk name>",
-                "description": "<1–2 sentences>"
-            }},
-            {{
-                "name": "<risk name>",
-                "description": "<1–2 sentences>"
-            }}
-        ],
-        "opportunities": [
-            {{
-                "name": "<opportunity name>",
-                "description": "<1–2 sentences>"
-            }},
-            {{
-                "name": "<opportunity name>",
-                "description": "<1–2 sentences>"
-            }}
-        ]
-    }},
-    "actionable_recommendations": [
-        {{
-        "recommendation": "<action>",
-        "ownership": "<team>",
-        "impact": "<impact>"
-        }},
-        {{
-        "recommendation": "<action>",
-        "ownership": "<team>",
-        "impact": "<impact>"
-        }},
-        {{
-        "recommendation": "<action>",
-        "ownership": "<team>",
-        "impact": "<impact>"
-        }}
-    ],
-    "note": "<brief limitations>"
-    }}
-}}
-}}
-    """
-    return prompt.strip()
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
 
 
 def compute_global_stats(df, sub_agg, dim_agg):
@@ -273,6 +277,47 @@ def compute_dataset_metadata(df: pd.DataFrame,
     return metadata
 
 
+# Retry settings for the overall LLM call.
+# Transient errors (5xx, timeouts, bad JSON) are retried with exponential backoff
+# and full jitter; quota / rate-limit errors open the circuit breaker instead,
+# so further calls fail fast rather than hammering a limited endpoint.
+# This is the only retry layer: each attempt is a single call_deepseek_json(retry=False).
+LLM_MAX_ATTEMPTS = 5
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 30.0
+LLM_BREAKER_COOLDOWN = 300.0
+
+_breaker = {"open_until": 0.0}
+
+
+# The executive report is the longest reply; keep the full 1200-token cap.
+OVERALL_MAX_TOKENS = 1200
+
+
+def _call_once(client, model: str, prompt):
+    return call_deepseek_json(client, model, prompt, retry=False, max_tokens=OVERALL_MAX_TOKENS)
+
+
+def call_llm_with_backoff(client, model: str, prompt, call_fn=None, sleep_fn=time.sleep):
+    # Call the LLM with exponential backoff + jitter and a simple circuit breaker.
+    call_fn = call_fn or _call_once
+    if time.time() < _breaker["open_until"]:
+        raise RuntimeError("Circuit open after a quota / rate limit error; skipping LLM call.")
+
+    for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+        try:
+            return call_fn(client, model, prompt)
+        except Exception as e:
+            if is_quota_or_ratelimit_error(e):
+                _breaker["open_until"] = time.time() + LLM_BREAKER_COOLDOWN
+                raise
+            if attempt == LLM_MAX_ATTEMPTS:
+                raise
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** (attempt - 1)))
+            print(f"[warn] LLM retry {attempt}/{LLM_MAX_ATTEMPTS - 1}: {e}; sleep {delay:.1f}s")
+            sleep_fn(delay)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Generate an overall corporate culture JSON summary from comments.csv."
@@ -315,9 +360,8 @@ def main():
     # 4. Dataset metadata
     dataset_metadata = compute_dataset_metadata(df, global_stats, sub_agg, dim_agg)
 
-    # 5. Build prompt
+    # 5. Build prompt (system prefix + user stats)
     prompt = build_overall_prompt(
-        report_title=args.title,
         global_stats=global_stats,
         top_dimensions=top_dimensions,
         top_subthemes=top_subthemes,
@@ -326,7 +370,15 @@ def main():
     # 6. Call DeepSeek
     client = build_client()
     try:
-        json_obj = call_deepseek_json(client, args.model, prompt)
+        json_obj = expand_keys(call_llm_with_backoff(client, args.model, prompt))
+
+        # Title and numbers are known locally; they are not requested from the model.
+        json_obj.pop("report_title", None)
+        json_obj = {"report_title": args.title, **json_obj}
+        briefing = json_obj.get("section", {}).get("executive_briefing", {})
+        sent_conf = briefing.setdefault("sentiment_and_confidence", {})
+        sent_conf["counts"] = global_stats["sentiment_counts"]
+        sent_conf["average_confidence"] = global_stats["average_confidence"]
     except Exception as e:
         print(f"[error] LLM failed: {e}")
         if is_quota_or_ratelimit_error(e):
@@ -11,6 +11,13 @@
 #   # Skip the neutral sentiment re-check step:
 #   #   python pipeline.py ../data/raw/data.csv --skip-neutral
 #   #
+#   # Run each step in its own Python process (slower, fully isolated):
+#   #   python pipeline.py ../data/raw/data.csv --subprocess
+#   #
+#   # By default every step is imported and its main(argv) called in-process,
+#   # so torch/transformers are imported once. A finished step's models are
+#   # released before the next step loads its own.
+#   #
 #   # Pipeline steps (mapped to existing scripts):
 #   #   1) data_process.py
 #   #      -> Generate comments.csv and subthemes.csv
@@ -26,8 +33,11 @@
 from __future__ import annotations
 
 import argparse
+import gc
+import importlib
 import subprocess
 import sys
+import traceback
 from pathlib import Path
 
 
@@ -46,6 +56,49 @@ def run_cmd(cmd, cwd: Path | None = None) -> None:
         )
 
 
+def run_step(script: str, args: list, cwd: Path, use_subprocess: bool = False) -> None:
+    # Run one pipeline step.
+    # In-process: import the script as a module and call its main(argv).
+    # Subprocess: fall back to `python <script> <args>` via run_cmd.
+    if use_subprocess:
+        run_cmd([sys.executable, str(cwd / script), *[str(a) for a in args]], cwd=cwd)
+        return
+
+    printable = " ".join([script, *[str(a) for a in args]])
+    print(f"\n[RUN] {printable}")
+    if str(cwd) not in sys.path:
+        sys.path.insert(0, str(cwd))
+    name = Path(script).stem
+    try:
+        module = importlib.import_module(name)
+        module.main([str(a) for a in args])
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise SystemExit(f"[ERROR] Step failed with exit code {e.code}: {printable}")
+    except Exception as e:
+        traceback.print_exc()
+        raise SystemExit(f"[ERROR] Step failed: {printable}: {e}")
+    finally:
+        release_step(name)
+
+
+def release_step(name: str) -> None:
+    # Free what a finished in-process step keeps alive: its lru_cache'd model
+    # getters (RoBERTa/SST-2 in sentiment_dbcheck) and import-time models
+    # (train_cr_encoder's bi-encoders), so the next step does not load on top.
+    module = sys.modules.pop(name, None)
+    if module is None:
+        return
+    for obj in list(vars(module).values()):
+        if getattr(obj, "__module__", None) == name and hasattr(obj, "cache_clear"):
+            obj.cache_clear()
+    del module
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
 def main(argv: list[str] | None = None) -> None:
     parser = argparse.ArgumentParser(
         description="Run the full backend NLP pipeline.",
@@ -72,6 +125,13 @@ def main(argv: list[str] | None = None) -> None:
         help="Skip sentiment_dbcheck.py (do not re-check neutral subthemes).",
     )
 
+    # Optional: run steps as separate processes
+    parser.add_argument(
+        "--subprocess",
+        action="store_true",
+        help="Run each step in a separate Python process instead of in-process.",
+    )
+
     args = parser.parse_args(argv)
 
     # Basic paths
@@ -106,13 +166,11 @@ def main(argv: list[str] | None = None) -> None:
 
     # Step 1. data_process.py
     print("[1/5] Running data_process.py ...")
-    run_cmd(
-        [
-            sys.executable,
-            str(backend_dir / "data_process.py"),
-            str(raw_csv),
-        ],
+    run_step(
+        "data_process.py",
+        [raw_csv],
         cwd=backend_dir,
+        use_subprocess=args.subprocess,
     )
 
     if not comments_csv.exists():
@@ -125,13 +183,11 @@ def main(argv: list[str] | None = None) -> None:
         print("[2/5] Skipping sentiment_dbcheck.py (per --skip-neutral).")
     else:
         print("[2/5] Running sentiment_dbcheck.py ...")
-        run_cmd(
-            [
-                sys.executable,
-                str(backend_dir / "sentiment_dbcheck.py"),
-                str(comments_csv),
-            ],
+        run_step(
+            "sentiment_dbcheck.py",
+            [comments_csv],
             cwd=backend_dir,
+            use_subprocess=args.subprocess,
         )
 
     # Step 3. train_cr_encoder.py (optional)
@@ -142,28 +198,22 @@ def main(argv: list[str] | None = None) -> None:
                 f"[ERROR] gold_labels.csv not found at {gold_csv}. "
                 f"Create it before using --train-ce."
             )
-        run_cmd(
-            [
-                sys.executable,
-                str(backend_dir / "train_cr_encoder.py"),
-                str(subthemes_csv),
-                str(gold_csv),
-            ],
+        run_step(
+            "train_cr_encoder.py",
+            [subthemes_csv, gold_csv],
             cwd=backend_dir,
+            use_subprocess=args.subprocess,
         )
     else:
         print("[3/5] Skipping Cross-Encoder training.")
 
     # Step 4. subtheme_classify_cluster.py
     print("[4/5] Running subtheme_classify_cluster.py ...")
-    run_cmd(
-        [
-            sys.executable,
-            str(backend_dir / "subtheme_classify_cluster.py"),
-            str(subthemes_csv),
-            str(dim_clusters_json),
-        ],
+    run_step(
+        "subtheme_classify_cluster.py",
+        [subthemes_csv, dim_clusters_json],
         cwd=backend_dir,
+        use_subprocess=args.subprocess,
     )
 
     if not dim_clusters_json.exists():
@@ -173,14 +223,11 @@ def main(argv: list[str] | None = None) -> None:
 
     # Step 5. mapping_sub2dim.py
     print("[5/5] Running mapping_sub2dim.py ...")
-    run_cmd(
-        [
-            sys.executable,
-            str(backend_dir / "mapping_sub2dim.py"),
-            str(comments_csv),
-            str(dim_clusters_json),
-        ],
+    run_step(
+        "mapping_sub2dim.py",
+        [comments_csv, dim_clusters_json],
         cwd=backend_dir,
+        use_subprocess=args.subprocess,
     )
 
     print("Pipeline finished successfully.")
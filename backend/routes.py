@@ -1,4 +1,5 @@
 import csv
+import numpy as np
 from flask import jsonify, request, abort, session
 from werkzeug.security import check_password_hash, generate_password_hash
 
@@ -8,11 +9,13 @@ from config import (
 )
 from utils import (
     _s, _split_pipes, _json_try, _to_ymd_series, _normalize_parent_id,
-    _read_sql, _read_csv_safe, _slugify, _is_valid_email
+    _read_csv_safe, _slugify, _is_valid_email
 )
 from models import (
-    load_posts, load_comments_by_tag, load_sbi_info, load_sbi_table,
-    _read_json_file, _load_mapping, _read_mapping_exploded, _load_users
+    load_posts, load_posts_snapshot, period_filter, dimension_mask, sentiment_matrix, text_search_mask, SENT_CODES,
+    load_comment_counts, load_comments_by_tag,
+    load_sbi_info, load_sbi_table,
+    _read_json_file, _load_mapping, _read_mapping_exploded, _load_users, _remember_user
 )
 
 def register_routes(app):
@@ -43,14 +46,7 @@ def register_routes(app):
     def ca_subthemes():
         dim = request.args.get("dimension", "").strip()
         m = _load_mapping()
-        subs = m["by_dim"].get(dim, [])
-        seen, out = set(), []
-        for s in subs:
-            if s["name"] in seen:
-                continue
-            seen.add(s["name"])
-            out.append(s)
-        return jsonify({"dimension": dim, "subthemes": out})
+        return jsonify({"dimension": dim, "subthemes": m["subs_of_dim"].get(dim, [])})
 
     @app.get("/api/ca/subtheme/by-file/<path:filename>")
     def ca_subtheme_by_file(filename):
@@ -90,45 +86,29 @@ def register_routes(app):
     # ----- Sentiment Aggregate -----
     @app.get("/api/sentiment_stats")
     def api_sentiment_stats():
-        posts = load_posts().copy()
+        snap = load_posts_snapshot()
+        posts = snap["df"]
 
         y = request.args.get("year", type=int)
         m = request.args.get("month", type=int)
-        if y or m:
-            tt = pd.to_datetime(posts["time"], errors="coerce", utc=False, format="mixed")
-            posts = posts.assign(_y=tt.dt.year, _m=tt.dt.month)
-            if y:
-                posts = posts[posts["_y"] == y]
-            if m:
-                posts = posts[posts["_m"] == m]
+        posts = period_filter(snap, posts, y, m)
 
         dim = (request.args.get("dimension") or "").strip()
         if dim:
-            posts = posts[posts["dimensions"].apply(lambda arr: isinstance(arr, list) and dim in arr)]
+            posts = posts[dimension_mask(snap, posts, dim)]
 
         only_sub = (request.args.get("subtheme") or "").strip()
 
-        pos = 0
-        neg = 0
-        for _, r in posts.iterrows():
-            ss = r.get("subs_sentiment")
-            if not isinstance(ss, dict):
-                continue
-            if only_sub:
-                val = str(ss.get(only_sub, "")).lower().strip()
-                if val == "positive":
-                    pos += 1
-                elif val == "negative":
-                    neg += 1
-            else:
-                for v in ss.values():
-                    vv = str(v).lower().strip()
-                    if vv == "positive":
-                        pos += 1
-                    elif vv == "negative":
-                        neg += 1
+        vocab, mat = sentiment_matrix(snap, posts)
+        if only_sub:
+            col = vocab.get(only_sub)
+            codes = mat[:, col].toarray().ravel() if col is not None else np.zeros(0, dtype=np.int8)
+        else:
+            codes = mat.data
+        pos = int((codes == SENT_CODES["positive"]).sum())
+        neg = int((codes == SENT_CODES["negative"]).sum())
 
-        return jsonify({"positive": int(pos), "negative": int(neg)})
+        return jsonify({"positive": pos, "negative": neg})
 
     # ----- Dimension / Subtheme counts -----
     import pandas as pd  # local import to avoid circulars
@@ -138,25 +118,17 @@ def register_routes(app):
         month = request.args.get("month", type=int)
 
         def from_db(y=None, m=None):
-            posts = load_posts().copy()
-            if y or m:
-                tt = pd.to_datetime(posts["time"], errors="coerce", utc=False, format="mixed")
-                posts = posts.assign(_y=tt.dt.year, _m=tt.dt.month)
-                if y: posts = posts[posts["_y"] == y]
-                if m: posts = posts[posts["_m"] == m]
-
-            rows = []
-            for _, r in posts.iterrows():
-                dims = r.get("dimensions")
-                if isinstance(dims, list):
-                    for d in dims:
-                        if d: rows.append({"dimension": str(d)})
-            if not rows:
+            snap = load_posts_snapshot()
+            posts = snap["df"]
+            posts = period_filter(snap, posts, y, m)
+
+            s = posts["dimensions"].explode().dropna()
+            s = s[s.astype(bool)].astype(str)
+            if s.empty:
                 return []
-            df = pd.DataFrame(rows)
-            g = df.groupby("dimension", as_index=False).size().rename(columns={"size": "count"})
-            g = g.sort_values("count", ascending=False)
-            return [{"name": str(r["dimension"]), "count": int(r["count"])} for _, r in g.iterrows()]
+            # name order first, then by count, matching the old groupby + sort_values ordering
+            vc = s.value_counts().sort_index().sort_values(ascending=False)
+            return [{"name": k, "count": int(v)} for k, v in vc.items()]
 
         if year or month:
             return jsonify(from_db(year, month))
@@ -188,117 +160,75 @@ def register_routes(app):
         if dim:
             allowed_subs = set(map_df.loc[map_df["dimension"] == dim, "subtheme"].unique().tolist())
 
-        posts = load_posts().copy()
-        if year or month:
-            tt = pd.to_datetime(posts["time"], errors="coerce", utc=False, format="mixed")
-            posts = posts.assign(_y=tt.dt.year, _m=tt.dt.month)
-            if year:  posts = posts[posts["_y"] == year]
-            if month: posts = posts[posts["_m"] == month]
+        snap = load_posts_snapshot()
+        posts = snap["df"]
+        posts = period_filter(snap, posts, year, month)
 
         if dim:
-            posts = posts[posts["dimensions"].apply(lambda arr: isinstance(arr, list) and dim in arr)]
-
-        counter = {}
-        def bump(name: str):
-            name = (name or "").strip()
-            if not name:
-                return
-            if allowed_subs is not None and name not in allowed_subs:
-                return
-            counter[name] = counter.get(name, 0) + 1
-
-        for _, r in posts.iterrows():
-            ss = r.get("subs_sentiment")
-            used = False
-            if isinstance(ss, dict) and ss:
-                for k in ss.keys():
-                    bump(str(k))
-                    used = True
-            if not used:
-                subs = r.get("subthemes")
-                if isinstance(subs, list):
-                    for k in subs:
-                        bump(str(k))
-
-        out = [{"name": k, "count": int(v)} for k, v in counter.items()]
-        out.sort(key=lambda x: x["count"], reverse=True)
+            posts = posts[dimension_mask(snap, posts, dim)]
+
+        # Keys of a non-empty subs_sentiment dict win; otherwise fall back to the subthemes list
+        ss = posts["subs_sentiment"]
+        has_dict = ss.map(lambda d: isinstance(d, dict) and bool(d)).astype(bool)
+        keys = pd.concat([
+            ss[has_dict].map(list),
+            posts.loc[~has_dict, "subthemes"].map(lambda x: x if isinstance(x, list) else []),
+        ]).sort_index()
+
+        names = keys.explode().dropna().astype(str).str.strip()
+        names = names[names != ""]
+        if allowed_subs is not None:
+            names = names[names.isin(allowed_subs)]
+
+        # first-seen order, then a stable sort by count
+        vc = names.value_counts(sort=False).sort_values(ascending=False, kind="stable")
+        out = [{"name": k, "count": int(v)} for k, v in vc.items()]
         return jsonify(out)
 
     # ----- Posts listing -----
     @app.get("/api/posts")
     def api_posts():
-        posts = load_posts()
+        snap = load_posts_snapshot()
+        posts = snap["df"]
 
         # Fill comment_count from DB if not provided in file
+        is_forum = posts["type"] == "forum"
         if posts["comment_count_file"].isna().all():
-            forum_tags = posts[posts["type"] == "forum"]["tag"].tolist()
-            if forum_tags:
-                placeholders = ",".join(["?"] * len(forum_tags))
-                sql = f"SELECT Tag, COUNT(1) AS cnt FROM reddit WHERE Tag IN ({placeholders}) GROUP BY Tag"
-                cdf = _read_sql(REDDIT_DB, sql, tuple(forum_tags))
-                cmt_map = dict(zip(cdf["Tag"].astype(str), cdf["cnt"].astype(int)))
-            else:
-                cmt_map = {}
-            posts = posts.assign(
-                comment_count=posts.apply(
-                    lambda r: int(cmt_map.get(str(r["tag"]), 0)) if r["type"] == "forum" else 0, axis=1
-                )
-            )
+            cmt_map = load_comment_counts() if is_forum.any() else {}
+            counts = posts["tag"].map(cmt_map)
         else:
-            posts = posts.assign(
-                comment_count=posts.apply(
-                    lambda r: int(r["comment_count_file"] or 0) if r["type"] == "forum" else 0, axis=1
-                )
-            )
+            counts = posts["comment_count_file"]
+        posts = posts.assign(comment_count=counts.fillna(0).where(is_forum, 0).astype(int))
 
         # Filters
         import pandas as pd
         y = request.args.get("year", type=int)
         m = request.args.get("month", type=int)
-        if y or m:
-            tt = pd.to_datetime(posts["time"], errors="coerce", utc=False, format="mixed")
-            posts = posts.assign(_y=tt.dt.year, _m=tt.dt.month)
-            if y: posts = posts[posts["_y"] == y]
-            if m: posts = posts[posts["_m"] == m]
+        posts = period_filter(snap, posts, y, m)
 
         dim = (request.args.get("dimension") or "").strip()
         sub = (request.args.get("subtheme") or "").strip()
         sent = (request.args.get("sentiment") or "").strip().lower()  # "positive"/"negative" / ""
 
         if dim:
-            posts = posts[posts["dimensions"].apply(lambda arr: isinstance(arr, list) and dim in arr)]
-
-        if sub:
-            def has_subtheme(r):
-                ss = r.get("subs_sentiment")
-                if isinstance(ss, dict) and sub in ss:
-                    if sent in ("positive", "negative"):
-                        return str(ss.get(sub, "")).lower().strip() == sent
-                    return True
-                subs = r.get("subthemes")
-                if isinstance(subs, list) and sub in subs:
-                    if sent in ("positive", "negative"):
-                        return True
-                    return True
-                return False
-            posts = posts[posts.apply(has_subtheme, axis=1)]
-        elif sent in ("positive", "negative"):
-            def has_sentiment_any(r):
-                ss = r.get("subs_sentiment")
-                if not isinstance(ss, dict):
-                    return False
-                return any(str(v).lower().strip() == sent for v in ss.values())
-            posts = posts[posts.apply(has_sentiment_any, axis=1)]
+            posts = posts[dimension_mask(snap, posts, dim)]
+
+        if sub or sent in ("positive", "negative"):
+            vocab, mat = sentiment_matrix(snap, posts)
+            want = SENT_CODES.get(sent)
+            if sub:
+                # a subs_sentiment entry decides; otherwise fall back to the plain subthemes list
+                col = vocab.get(sub)
+                codes = mat[:, col].toarray().ravel() if col is not None else np.zeros(len(posts), dtype=np.int8)
+                in_list = posts["subthemes"].map(lambda subs: isinstance(subs, list) and sub in subs).to_numpy(dtype=bool)
+                keep = np.where(codes != 0, codes == want if want is not None else True, in_list)
+            else:
+                keep = np.asarray((mat == want).sum(axis=1)).ravel() > 0
+            posts = posts[keep]
 
         q = (request.args.get("q") or "").strip().lower()
         if q:
-            posts = posts[
-                posts["title"].str.lower().str.contains(q, na=False)
-                | posts["content"].str.lower().str.contains(q, na=False)
-                | posts["author"].str.lower().str.contains(q, na=False)
-                | posts["source"].str.lower().str.contains(q, na=False)
-                | posts["dimensions"].apply(lambda arr: any(q in d.lower() for d in (arr or [])))
-            ]
+            posts = posts[text_search_mask(snap, posts, q)]
 
         # Pagination
         try:
@@ -308,7 +238,8 @@ def register_routes(app):
             page, size = 1, 10
 
         start, end = (page - 1) * size, (page - 1) * size + size
-        page_df = posts.iloc[start:end].copy()
+        cols = ["id", "tag", "title", "author", "time", "score", "comment_count", "type", "source", "dimensions"]
+        recs = posts.iloc[start:end][cols].to_dict(orient="records")
 
         items = [{
             "id": _s(r["id"]),
@@ -322,7 +253,7 @@ def register_routes(app):
             "type": _s(r["type"]),
             "source": _s(r["source"]),
             "dimensions": list(r["dimensions"] or []),
-        } for _, r in page_df.iterrows()]
+        } for r in recs]
 
         return jsonify({"total": int(len(posts)), "page": page, "size": size, "items": items})
 
@@ -374,6 +305,8 @@ def register_routes(app):
         except Exception:
             df = df.assign(_t=pd.NaT)
 
+        df["comment_id_norm"] = np.frompyfunc(_normalize_parent_id, 1, 1)(df["comment_id"].to_numpy())
+
         parents = df[df["level"] == 1].sort_values(by=["score", "_t"], ascending=[False, False])
         total_parents = int(len(parents))
 
@@ -384,26 +317,24 @@ def register_routes(app):
             page, size = 1, 10
 
         start, end = (page - 1) * size, (page - 1) * size + size
-        page_parents = parents.iloc[start:end].copy()
+        page_parents = parents.iloc[start:end].to_dict("records")
 
-        parent_ids = set(page_parents["comment_id"].map(_normalize_parent_id))
-        df["comment_id_norm"] = df["comment_id"].map(_normalize_parent_id)
-        children = df[(df["level"] == 2) & (df["parent_id_norm"].isin(parent_ids))].copy()
+        parent_ids = {pr["comment_id_norm"] for pr in page_parents}
+        children = df[(df["level"] == 2) & (df["parent_id_norm"].isin(parent_ids))].to_dict("records")
 
         ordered = []
-        pmap = { _normalize_parent_id(r["comment_id"]): r for _, r in page_parents.iterrows() }
+        pmap = {pr["comment_id_norm"]: pr for pr in page_parents}
         grouped = {pid: [] for pid in parent_ids}
-        for _, cr in children.iterrows():
+        for cr in children:
             grouped.setdefault(cr["parent_id_norm"], []).append(cr)
         for pid, pr in pmap.items():
             ordered.append(pr)
             for cr in grouped.get(pid, []):
                 ordered.append(cr)
 
-        import pandas as pd
         items = [{
             "comment_id": _s(r["comment_id"]),
-            "comment_id_norm": _s(r.get("comment_id_norm", _normalize_parent_id(r["comment_id"]))),
+            "comment_id_norm": _s(r["comment_id_norm"]),
             "author": _s(r["author"]),
             "content": _s(r["content"]),
             "score": int(r["score"]),
@@ -412,7 +343,7 @@ def register_routes(app):
             "level": int(r["level"]),
             "parent_id": _s(r["parent_id"]),
             "parent_comment_id_norm": _s(r["parent_id_norm"]),
-        } for _, r in pd.DataFrame(ordered).iterrows()]
+        } for r in ordered]
 
         return jsonify({"total": total_parents, "page": page, "size": size, "items": items})
 
@@ -479,5 +410,6 @@ def register_routes(app):
             if not file_exists:
                 writer.writeheader()
             writer.writerow({"email": email, "password_hash": password_hash, "name": name, "role": role})
+        _remember_user({"email": email, "name": name, "role": role, "password_hash": password_hash, "password": None})
         session["user"] = {"email": email, "name": name, "role": role}
         return jsonify({"message": "Register success", "user": session["user"]}), 201
@@ -10,12 +10,22 @@
 # Output: path/comments.csv [ID,text,subthemes,subs_sentiment,confidence,subs_evidences]
 
 import os, sys, json, math, nltk, torch
+import multiprocessing as mp
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
 import pandas as pd
 from pathlib import Path
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 from nltk.sentiment import SentimentIntensityAnalyzer
 
+try:  # optional: multi-threaded streaming CSV reader
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
 # ------------------------- CLI & Paths -------------------------
 CSV_IN: Path | None = None
 
@@ -28,6 +38,39 @@ nltk.data.path.insert(0, str(NLTK_DIR))
 
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# Opt-in torch.compile for the sentiment transformers (SENTI_COMPILE=1).
+# Compiled models get fixed-shape batches (padded to max_len) so the same kernels are reused.
+COMPILE_MODELS = os.getenv("SENTI_COMPILE", "0") == "1" and hasattr(torch, "compile")
+PADDING = "max_length" if COMPILE_MODELS else True
+
+def _maybe_compile(mdl):
+    if not COMPILE_MODELS:
+        return mdl
+    try:
+        return torch.compile(mdl, mode="reduce-overhead", dynamic=False)
+    except Exception as e:
+        print(f"[Warn] torch.compile failed, using eager model: {e}")
+        return mdl
+
+# CPU: int8 dynamic quantization of Linear layers; CUDA: fp16 weights (SENTI_INT8=0 keeps fp32).
+QUANTIZE_MODELS = os.getenv("SENTI_INT8", "1") == "1"
+
+def _maybe_quantize(mdl, device):
+    if not QUANTIZE_MODELS:
+        return mdl
+    if device.type == "cuda":
+        return mdl.half()
+    try:
+        from torch.ao.quantization import quantize_dynamic
+        return quantize_dynamic(mdl, {torch.nn.Linear}, dtype=torch.qint8)
+    except Exception as e:
+        print(f"[Warn] int8 quantization skipped: {e}")
+        return mdl
+
+def _autocast():
+    # fp16 autocast on CUDA; disabled (plain fp32) on CPU
+    return torch.autocast(device_type=DEVICE.type, dtype=torch.float16, enabled=(DEVICE.type == "cuda"))
+
 REQUIRED_COLS = ["ID", "text", "subthemes", "subs_sentiment", "confidence", "subs_evidences"]
 
 # ------------------------- Utils -------------------------
@@ -35,6 +78,10 @@ def round_conf(v: float, ndigits=3) -> float:
     v = max(0.0, min(1.0, float(v)))
     return round(v, ndigits)
 
+def round_conf_array(v, ndigits=3) -> np.ndarray:
+    """round_conf over a whole array."""
+    return np.round(np.clip(np.asarray(v, dtype=float), 0.0, 1.0), ndigits)
+
 def safe_json_loads(s, default):
     try:
         if s is None or (isinstance(s, float) and math.isnan(s)):
@@ -55,59 +102,243 @@ def ensure_vader():
     except LookupError:
         nltk.download("vader_lexicon", download_dir=str(NLTK_DIR))
 
-ensure_vader()
-_VADER = SentimentIntensityAnalyzer()
+@lru_cache(maxsize=None)
+def _get_vader():
+    ensure_vader()
+    return SentimentIntensityAnalyzer()
+
+# VADER is pure Python; on CUDA runs large inputs are scored across the otherwise
+# idle CPU cores. On CPU runs the transformers already use every core, so VADER
+# stays on one background thread.
+VADER_POOL_MIN = 2000  # below this, process start-up costs more than it saves
+
+# One process pool per main() run, started before any model loads and reused by
+# every chunk (see _start_vader_pool); None means the thread path.
+_VADER_POOL = None
+
+def _vader_compound(t):
+    # Score one text -> compound score in [-1, 1]
+    return float(_get_vader().polarity_scores(t or "").get("compound", 0.0))
+
+def _start_vader_pool():
+    """
+    Start the VADER worker pool, or return None when it would not help.
+    Workers come from a forkserver (spawn where that is unavailable), never a
+    fork of this process, so threads started by torch cannot deadlock them.
+    """
+    workers = os.cpu_count() or 1
+    if DEVICE.type != "cuda" or workers < 2:
+        return None
+    _get_vader()  # make sure the lexicon is present before workers start
+    methods = mp.get_all_start_methods()
+    ctx = mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+    if "forkserver" in methods:
+        ctx.set_forkserver_preload([__name__])  # import once in the server, not per worker
+    return ctx.Pool(workers, initializer=_get_vader)  # one analyzer per worker
+
+def pred_vader_async(texts):
+    """
+    Start scoring `texts` with VADER in the background; returns a function that
+    waits for and returns (labels, pos_probs). Lets VADER run on the CPU while
+    the transformer models are busy. Uses the shared pool when main() started
+    one, otherwise a single background thread.
+    """
+    pool = _VADER_POOL
+    if pool is not None and len(texts) >= VADER_POOL_MIN:
+        chunksize = max(1, len(texts) // ((os.cpu_count() or 1) * 4))
+        pending = pool.map_async(_vader_compound, texts, chunksize=chunksize)
+        return lambda: _split_vader(pending.get())
+
+    ex = ThreadPoolExecutor(max_workers=1)
+    pending = ex.submit(lambda: [_vader_compound(t) for t in texts])
+    ex.shutdown(wait=False)
+    return lambda: _split_vader(pending.result())
+
+def _split_vader(results):
+    # compound scores -> (labels, pos_probs) in one vectorized pass
+    comp = np.fromiter(results, dtype=float, count=len(results))
+    labels = np.where(comp >= 0, "positive", "negative")
+    pos_probs = (comp + 1.0) / 2.0  # [-1,1] -> [0,1]
+    return labels, pos_probs
 
 def pred_vader(texts):
-    labels, pos_probs = [], []
-    for t in texts:
-        t = t or ""
-        s = _VADER.polarity_scores(t)
-        comp = float(s.get("compound", 0.0))
-        pos_p = (comp + 1.0) / 2.0  # [-1,1] -> [0,1]
-        lab = "positive" if comp >= 0 else "negative"
-        labels.append(lab)
-        pos_probs.append(pos_p)
+    return pred_vader_async(texts)()
+
+# ------------------------- Tokenized batches -------------------------
+# On CUDA, the next batch is tokenized on a background thread while the GPU runs the
+# current one (fast tokenizers release the GIL). No worker processes are forked, so
+# the CUDA/shard threads and the VADER pool's handler threads are never copied.
+TOKENIZE_AHEAD = os.getenv("SENTI_TOKENIZE_AHEAD", "1" if DEVICE.type == "cuda" else "0") == "1"
+
+def _tokenize(tok, batch, max_len):
+    batch = [x if isinstance(x, str) else "" for x in batch]
+    enc = tok(batch, return_tensors="pt", padding=PADDING, truncation=True, max_length=max_len)
+    if DEVICE.type == "cuda":
+        enc = {k: v.pin_memory() for k, v in enc.items()}  # lets .to(device) run async
+    return enc
+
+def _encoded_batches(tok, texts, max_len, bs, device=DEVICE):
+    starts = range(0, len(texts), bs)
+    if not TOKENIZE_AHEAD or len(texts) <= bs:
+        for off in starts:
+            enc = _tokenize(tok, texts[off:off + bs], max_len)
+            yield {k: v.to(device, non_blocking=True) for k, v in enc.items()}
+        return
+    # one thread per call: each device's tokenizer is only ever used by its own prefetcher
+    ex = ThreadPoolExecutor(max_workers=1)
+    try:
+        pending = ex.submit(_tokenize, tok, texts[0:bs], max_len)
+        for off in starts:
+            enc = pending.result()
+            if off + bs < len(texts):
+                pending = ex.submit(_tokenize, tok, texts[off + bs:off + 2 * bs], max_len)
+            yield {k: v.to(device, non_blocking=True) for k, v in enc.items()}
+    finally:
+        ex.shutdown(wait=True, cancel_futures=True)
+
+# ------------------------- Multi-GPU sharding -------------------------
+# With several GPUs, each gets a contiguous shard of the (length-sorted) texts and
+# its own model replica; shards run in threads (CUDA kernels release the GIL).
+MULTI_GPU = os.getenv("SENTI_MULTI_GPU", "1") == "1"
+
+def _devices():
+    if DEVICE.type == "cuda" and MULTI_GPU and torch.cuda.device_count() > 1:
+        return [torch.device(f"cuda:{i}") for i in range(torch.cuda.device_count())]
+    return [DEVICE]
+
+def _run_sharded(pred_on, texts, max_len, bs):
+    devices = _devices()
+    if len(devices) == 1 or len(texts) <= bs:
+        return pred_on(texts, devices[0], max_len, bs)
+    shard = math.ceil(len(texts) / len(devices))
+    parts = [(texts[i * shard:(i + 1) * shard], dev) for i, dev in enumerate(devices)]
+    parts = [(part, dev) for part, dev in parts if len(part) > 0]
+    with ThreadPoolExecutor(max_workers=len(parts)) as ex:
+        results = list(ex.map(lambda a: pred_on(a[0], a[1], max_len, bs), parts))
+    labels = [lab for res in results for lab in res[0]]
+    pos_probs = [p for res in results for p in res[1]]
+    return labels, pos_probs
+
+# ------------------------- Optional ONNX Runtime backend -------------------------
+# SENTI_ONNX=1 runs RoBERTa/SST-2 through onnxruntime (fused attention kernels).
+# Each model is exported to MODELS_DIR/onnx once; without onnxruntime, or if the
+# export fails, the PyTorch path is used.
+USE_ONNX = os.getenv("SENTI_ONNX", "0") == "1"
+ONNX_DIR = MODELS_DIR / "onnx"
+
+@lru_cache(maxsize=None)
+def _get_onnx(repo):
+    """(tokenizer, InferenceSession, id2label) for `repo`, or None if unavailable."""
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        print("[Warn] SENTI_ONNX=1 but onnxruntime is not installed; using PyTorch.")
+        return None
+    try:
+        tok = AutoTokenizer.from_pretrained(repo, cache_dir=str(MODELS_DIR), use_fast=True)
+        mdl = AutoModelForSequenceClassification.from_pretrained(repo, cache_dir=str(MODELS_DIR)).eval()
+        path = ONNX_DIR / (repo.replace("/", "__") + ".onnx")
+        if not path.exists():
+            ONNX_DIR.mkdir(parents=True, exist_ok=True)
+            dummy = tok(["export"], return_tensors="pt")
+            axes = {0: "batch", 1: "seq"}
+            torch.onnx.export(
+                mdl, (dummy["input_ids"], dummy["attention_mask"]), str(path),
+                input_names=["input_ids", "attention_mask"], output_names=["logits"],
+                dynamic_axes={"input_ids": axes, "attention_mask": axes, "logits": {0: "batch"}},
+                opset_version=17,
+            )
+        available = ort.get_available_providers()
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in available]
+        sess = ort.InferenceSession(str(path), providers=providers)
+        return tok, sess, mdl.config.id2label
+    except Exception as e:
+        print(f"[Warn] ONNX backend for {repo} unavailable, using PyTorch: {e}")
+        return None
+
+def _pred_onnx(backend, texts, max_len, bs, pos_id, neg_id):
+    tok, sess, _ = backend
+    labels, pos_probs = np.empty(len(texts), dtype="<U8"), np.empty(len(texts))
+    for off in range(0, len(texts), bs):
+        batch = [x if isinstance(x, str) else "" for x in texts[off:off + bs]]
+        enc = tok(batch, return_tensors="np", padding=True, truncation=True, max_length=max_len)
+        logits = sess.run(None, {"input_ids": enc["input_ids"].astype(np.int64),
+                                 "attention_mask": enc["attention_mask"].astype(np.int64)})[0]
+        z = np.exp(logits - logits.max(axis=1, keepdims=True))
+        prob = z / z.sum(axis=1, keepdims=True)
+        k = len(batch)
+        labels[off:off + k] = np.where(prob[:, pos_id] >= prob[:, neg_id], "positive", "negative")
+        pos_probs[off:off + k] = prob[:, pos_id]
     return labels, pos_probs
 
 # ------------------------- 2) Twitter-RoBERTa -------------------------
 _RO_REPO = "cardiffnlp/twitter-roberta-base-sentiment-latest"
-_ro_tok  = AutoTokenizer.from_pretrained(_RO_REPO, cache_dir=str(MODELS_DIR))
-_ro_mdl  = AutoModelForSequenceClassification.from_pretrained(_RO_REPO, cache_dir=str(MODELS_DIR)).to(DEVICE).eval()
-_ro_id2label = _ro_mdl.config.id2label
-_ro_pos_id = next(i for i, n in _ro_id2label.items() if n.lower().startswith("pos"))
-_ro_neg_id = next(i for i, n in _ro_id2label.items() if n.lower().startswith("neg"))
+
+# Models are loaded lazily on first use and cached for the life of the process.
+@lru_cache(maxsize=None)
+def _get_roberta(device=DEVICE):
+    tok = AutoTokenizer.from_pretrained(_RO_REPO, cache_dir=str(MODELS_DIR), use_fast=True)
+    mdl = AutoModelForSequenceClassification.from_pretrained(_RO_REPO, cache_dir=str(MODELS_DIR)).to(device).eval()
+    id2label = mdl.config.id2label
+    pos_id = next(i for i, n in id2label.items() if n.lower().startswith("pos"))
+    neg_id = next(i for i, n in id2label.items() if n.lower().startswith("neg"))
+    return tok, _maybe_compile(_maybe_quantize(mdl, device)), pos_id, neg_id
 
 def pred_roberta(texts, max_len=256, bs=64):
-    labels, pos_probs = [], []
-    for i in range(0, len(texts), bs):
-        batch = [x if isinstance(x, str) else "" for x in texts[i:i+bs]]
-        enc = _ro_tok(batch, return_tensors="pt", padding=True, truncation=True, max_length=max_len).to(DEVICE)
-        with torch.no_grad():
-            prob = torch.softmax(_ro_mdl(**enc).logits, dim=-1).cpu().numpy()
-        for j in range(len(batch)):
-            p_pos, p_neg = float(prob[j, _ro_pos_id]), float(prob[j, _ro_neg_id])
-            labels.append("positive" if p_pos >= p_neg else "negative")
-            pos_probs.append(p_pos)
+    backend = _get_onnx(_RO_REPO) if USE_ONNX else None
+    if backend is not None:
+        id2label = backend[2]
+        pos_id = next(i for i, n in id2label.items() if n.lower().startswith("pos"))
+        neg_id = next(i for i, n in id2label.items() if n.lower().startswith("neg"))
+        return _pred_onnx(backend, texts, max_len, bs, pos_id, neg_id)
+    return _run_sharded(_pred_roberta_on, texts, max_len, bs)
+
+def _pred_roberta_on(texts, device, max_len, bs):
+    _ro_tok, _ro_mdl, _ro_pos_id, _ro_neg_id = _get_roberta(device)
+    # outputs are preallocated and filled batch by batch
+    labels, pos_probs, off = np.empty(len(texts), dtype="<U8"), np.empty(len(texts)), 0
+    for enc in _encoded_batches(_ro_tok, texts, max_len, bs, device):
+        with torch.inference_mode():
+            with _autocast():
+                logits = _ro_mdl(**enc).logits
+            prob = torch.softmax(logits.float(), dim=-1)  # softmax in fp32
+            # label + P(pos) computed on device, one transfer per batch
+            out = torch.stack([prob[:, _ro_pos_id], (prob[:, _ro_pos_id] >= prob[:, _ro_neg_id]).float()], dim=1).cpu().numpy()
+        k = out.shape[0]
+        labels[off:off + k] = np.where(out[:, 1] > 0, "positive", "negative")
+        pos_probs[off:off + k] = out[:, 0]
+        off += k
     return labels, pos_probs
 
 # ------------------------- 3) SST-2 DistilBERT -------------------------
 _SST_REPO = "distilbert-base-uncased-finetuned-sst-2-english"
-_sst_tok  = AutoTokenizer.from_pretrained(_SST_REPO, cache_dir=str(MODELS_DIR))
-_sst_mdl  = AutoModelForSequenceClassification.from_pretrained(_SST_REPO, cache_dir=str(MODELS_DIR)).to(DEVICE).eval()
+
+@lru_cache(maxsize=None)
+def _get_sst2(device=DEVICE):
+    tok = AutoTokenizer.from_pretrained(_SST_REPO, cache_dir=str(MODELS_DIR), use_fast=True)
+    mdl = AutoModelForSequenceClassification.from_pretrained(_SST_REPO, cache_dir=str(MODELS_DIR)).to(device).eval()
+    return tok, _maybe_compile(_maybe_quantize(mdl, device))
 
 def pred_sst2(texts, max_len=256, bs=64):
-    labels, pos_probs = [], []
-    for i in range(0, len(texts), bs):
-        batch = [x if isinstance(x, str) else "" for x in texts[i:i+bs]]
-        enc = _sst_tok(batch, return_tensors="pt", padding=True, truncation=True, max_length=max_len).to(DEVICE)
-        with torch.no_grad():
-            prob = torch.softmax(_sst_mdl(**enc).logits, dim=-1).cpu().numpy()
-        for j in range(len(batch)):
-            pos_p = float(prob[j, 1])  # id=1 is "POSITIVE"
-            lab = "positive" if np.argmax(prob[j]) == 1 else "negative"
-            labels.append(lab)
-            pos_probs.append(pos_p)
+    backend = _get_onnx(_SST_REPO) if USE_ONNX else None
+    if backend is not None:
+        return _pred_onnx(backend, texts, max_len, bs, 1, 0)  # id=1 is "POSITIVE"
+    return _run_sharded(_pred_sst2_on, texts, max_len, bs)
+
+def _pred_sst2_on(texts, device, max_len, bs):
+    _sst_tok, _sst_mdl = _get_sst2(device)
+    labels, pos_probs, off = np.empty(len(texts), dtype="<U8"), np.empty(len(texts)), 0
+    for enc in _encoded_batches(_sst_tok, texts, max_len, bs, device):
+        with torch.inference_mode():
+            with _autocast():
+                logits = _sst_mdl(**enc).logits
+            prob = torch.softmax(logits.float(), dim=-1)  # softmax in fp32
+            # id=1 is "POSITIVE"; label + P(pos) computed on device, one transfer per batch
+            out = torch.stack([prob[:, 1], (prob.argmax(dim=-1) == 1).float()], dim=1).cpu().numpy()
+        k = out.shape[0]
+        labels[off:off + k] = np.where(out[:, 1] > 0, "positive", "negative")
+        pos_probs[off:off + k] = out[:, 0]
+        off += k
     return labels, pos_probs
 
 # ------------------------- Voting (binary only) -------------------------
@@ -135,33 +366,71 @@ def majority_vote(ro_lab, ro_p, sst_lab, sst_p, vd_lab, vd_p):
     conf = round_conf((vote_strength + prob_strength) / 2.0)
     return final_lab, conf
 
+def majority_vote_arrays(ro_lab, ro_p, sst_lab, sst_p, vd_lab, vd_p):
+    """
+    Vectorized majority_vote over whole lists (same rule and confidence formula).
+    All three models emit strictly binary labels, so three votes never tie.
+    """
+    # labels as int8 votes (1 = positive, 0 = negative)
+    pos_votes = (
+        (np.asarray(ro_lab) == "positive").astype(np.int8)
+        + (np.asarray(sst_lab) == "positive").astype(np.int8)
+        + (np.asarray(vd_lab) == "positive").astype(np.int8)
+    )
+    labels = np.where(pos_votes >= 2, "positive", "negative")
+
+    mean_pos = (np.asarray(ro_p, dtype=float) + np.asarray(sst_p, dtype=float) + np.asarray(vd_p, dtype=float)) / 3.0
+    vote_strength = np.maximum(pos_votes, 3 - pos_votes) / 3.0
+    prob_strength = np.maximum(mean_pos, 1.0 - mean_pos)
+    confs = round_conf_array((vote_strength + prob_strength) / 2.0)
+    return labels.tolist(), confs.tolist()
+
+def _unsort(preds, order):
+    """Map (labels, pos_probs) computed on texts[order] back to the original order."""
+    labels, pos_probs = preds
+    inv = np.empty_like(order)
+    inv[order] = np.arange(len(order))
+    return np.asarray(labels)[inv], np.asarray(pos_probs, dtype=float)[inv]
+
 def infer_binary_sentiment(texts):
     """Run three models once for a list of texts, return (labels, confs)."""
-    ro_lab, ro_p = pred_roberta(texts)
-    sst_lab, sst_p = pred_sst2(texts)
-    vd_lab, vd_p = pred_vader(texts)
+    # VADER runs on the CPU in the background while the transformers work.
+    vader = pred_vader_async(texts)
+    # Feed both transformers the same length-sorted order so each batch holds
+    # texts of similar length (less padding), then scatter results back.
+    order = np.argsort([len(t) if isinstance(t, str) else 0 for t in texts], kind="stable")
+    sorted_texts = [texts[k] for k in order]
+    ro_lab, ro_p = _unsort(pred_roberta(sorted_texts), order)
+    sst_lab, sst_p = _unsort(pred_sst2(sorted_texts), order)
+    vd_lab, vd_p = vader()
 
-    outs_lab, outs_conf = [], []
-    for i in range(len(texts)):
-        lab, conf = majority_vote(ro_lab[i], ro_p[i], sst_lab[i], sst_p[i], vd_lab[i], vd_p[i])
-        outs_lab.append(lab); outs_conf.append(conf)
-    return outs_lab, outs_conf
+    return majority_vote_arrays(ro_lab, ro_p, sst_lab, sst_p, vd_lab, vd_p)
 
 # ------------------------- Main -------------------------
-def main():
-    if CSV_IN is None:
-        raise RuntimeError("CSV_IN is not set. This should only be called via __main__.")
-    
-    # 1) Read CSV (no extra columns; we will overwrite in-place)
-    df = pd.read_csv(CSV_IN, encoding="utf-8")
-    check_columns(df)
-    df = df.fillna("")
-    n = len(df)
-    if n == 0:
-        print("[Info] Empty file; nothing to do.")
+CHUNK_ROWS = 4096  # rows per CSV chunk; bounds peak memory on large files
+CSV_BLOCK_BYTES = 16 << 20  # pyarrow read block size
+
+def read_chunks(path: Path):
+    """Yield the CSV as DataFrames of at most CHUNK_ROWS rows."""
+    if pa_csv is None:
+        yield from pd.read_csv(path, encoding="utf-8", chunksize=CHUNK_ROWS)
         return
+    # Text columns stay strings (written back verbatim); confidence is numeric.
+    types = {c: pa.string() for c in REQUIRED_COLS if c != "confidence"}
+    types["confidence"] = pa.float64()
+    reader = pa_csv.open_csv(
+        str(path),
+        read_options=pa_csv.ReadOptions(use_threads=True, block_size=CSV_BLOCK_BYTES),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(column_types=types),
+    )
+    for batch in reader:
+        for off in range(0, batch.num_rows, CHUNK_ROWS):
+            yield batch.slice(off, CHUNK_ROWS).to_pandas()
 
-    # 2) Collect neutral targets (per-row per-subtheme)
+def process_chunk(df: pd.DataFrame) -> int:
+    """Re-check neutral subthemes in one chunk of rows (in place). Returns #re-evaluated."""
+    # 1) Collect neutral targets (per-row per-subtheme)
     #    Build a batch of texts to evaluate (evidence > text fallback)
     eval_items = []   # list of (row_idx, subtheme_name, eval_text)
     for i, row in df.iterrows():
@@ -176,38 +445,82 @@ def main():
                 eval_items.append((i, sub_name, txt_for_eval))
 
     if not eval_items:
-        print("[Info] No 'neutral' subthemes found. Nothing to update.")
-        return
+        return 0
 
-    # 3) Run models in batch on the evaluation texts
+    # 2) Run models in batch on the evaluation texts
+    #    Identical texts (short evidence quotes, reused row text) are scored once
     texts = [t for (_, _, t) in eval_items]
-    labs, confs = infer_binary_sentiment(texts)
+    first = {}
+    inv = np.fromiter((first.setdefault(t, len(first)) for t in texts), dtype=np.int64, count=len(texts))
+    u_labs, u_confs = infer_binary_sentiment(list(first))
+    labs = np.asarray(u_labs)[inv].tolist()
+    confs = np.asarray(u_confs, dtype=float)[inv].tolist()
 
-    # 4) Write back into subs_sentiment (JSON string). Update row 'confidence'.
+    # 3) Write back into subs_sentiment (JSON string), one decode/encode per row.
     #    row confidence := max(old_conf, mean(updated_conf_in_this_row)) [if any updated]
-    per_row_new_confs = {}  # row_idx -> [conf, ...]
-    for (i, sub_name, _), lab, cf in zip(eval_items, labs, confs):
-        # parse current JSON again (row may appear multiple times)
+    updates = defaultdict(dict)  # row_idx -> {sub_name: label}
+    for (i, sub_name, _), lab in zip(eval_items, labs):
+        updates[i][sub_name] = "positive" if lab == "positive" else "negative"  # force binary
+    rows_upd = list(updates)
+    new_json = []
+    for i in rows_upd:
         subs_map = safe_json_loads(df.at[i, "subs_sentiment"], {})
-        # force binary
-        subs_map[sub_name] = "positive" if lab == "positive" else "negative"
-        df.at[i, "subs_sentiment"] = json.dumps(subs_map, ensure_ascii=False)
-        per_row_new_confs.setdefault(i, []).append(cf)
-
-    # 5) Update row-level confidence conservatively
-    for i, conf_list in per_row_new_confs.items():
-        try:
-            old_conf = float(df.at[i, "confidence"])
-        except Exception:
-            old_conf = 0.0
-        mean_new = float(np.mean(conf_list)) if conf_list else 0.0
-        df.at[i, "confidence"] = round_conf(max(old_conf, mean_new))
-
-    # 6) Overwrite original file (no extra columns)
-    df = df[REQUIRED_COLS]  # enforce exact columns order
-    df.to_csv(CSV_IN, index=False, encoding="utf-8")
+        subs_map.update(updates[i])
+        new_json.append(json.dumps(subs_map, ensure_ascii=False))
+    df.loc[rows_upd, "subs_sentiment"] = new_json
+
+    # 4) Update row-level confidence conservatively (one grouped pass over all rows)
+    rows = np.fromiter((i for i, _, _ in eval_items), dtype=np.int64, count=len(eval_items))
+    mean_new = pd.Series(confs, dtype=float).groupby(rows, sort=False).mean()
+    old_conf = pd.to_numeric(df.loc[mean_new.index, "confidence"], errors="coerce").fillna(0.0).to_numpy()
+    df.loc[mean_new.index, "confidence"] = round_conf_array(np.maximum(old_conf, mean_new.to_numpy()))
+    return len(eval_items)
+
+def main(argv=None):
+    # argv: optional [comments.csv]; overrides CSV_IN (used by pipeline.py)
+    global CSV_IN, _VADER_POOL
+    if argv:
+        CSV_IN = Path(argv[0]).resolve()
+    if CSV_IN is None:
+        raise RuntimeError("CSV_IN is not set. This should only be called via __main__.")
+
+    # Stream the CSV in chunks into a temp file next to it, then swap it in.
+    # Models are cached, so they load once for all chunks; the VADER pool is
+    # started here, before any of them, and shared by all chunks.
+    tmp_out = CSV_IN.with_name(CSV_IN.name + ".tmp")
+    n_rows, n_eval = 0, 0
+    _VADER_POOL = _start_vader_pool()
+    try:
+        for chunk in read_chunks(CSV_IN):
+            check_columns(chunk)
+            chunk = chunk.fillna("").reset_index(drop=True)
+            n_eval += process_chunk(chunk)
+            # enforce exact columns order (no extra columns)
+            chunk[REQUIRED_COLS].to_csv(
+                tmp_out, mode="w" if n_rows == 0 else "a", header=(n_rows == 0),
+                index=False, encoding="utf-8",
+            )
+            n_rows += len(chunk)
+
+        if n_rows == 0:
+            print("[Info] Empty file; nothing to do.")
+            return
+        if n_eval == 0:
+            print("[Info] No 'neutral' subthemes found. Nothing to update.")
+            return
+
+        # Overwrite original file
+        os.replace(tmp_out, CSV_IN)
+    finally:
+        if _VADER_POOL is not None:
+            _VADER_POOL.close()
+            _VADER_POOL.join()
+            _VADER_POOL = None
+        if tmp_out.exists():
+            tmp_out.unlink()
+
     print(f"[Done] Updated {CSV_IN}")
-    print(f"  Re-evaluated neutral subthemes: {len(eval_items)}")
+    print(f"  Re-evaluated neutral subthemes: {n_eval}")
     return
 
 if __name__ == "__main__":
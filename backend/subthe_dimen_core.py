@@ -6,64 +6,178 @@
 
 from __future__ import annotations
 
+import hashlib
 import json
+import multiprocessing as mp
+import os
 import re
+import threading
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fnmatch import fnmatchcase
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
 from typing import Any, Dict, List, Callable
 
+import numpy as np
 import pandas as pd
 
+from utils import _CSV_PEEK_BYTES, _sniff_encoding
 
+try:  # optional: faster JSON parsing
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # optional: Arrow-backed strings for the free-text CSV columns
+    import pyarrow  # noqa: F401
+    _TEXT_DTYPE = "string[pyarrow]"
+except ImportError:
+    _TEXT_DTYPE = "string"
+
+# aggregate_by_subtheme shards rows over processes only for large frames;
+# below this, process start-up costs more than it saves.
+AGG_POOL_MIN_ROWS = 50_000
+AGG_WORKERS = 8
+
+# Columns the summaries read; load_df parses only these (others are skipped).
+_REQUIRED_COLS = (
+    "content", "dimensions", "subthemes", "subs_sentiment", "confidence",
+    "subs_evidences", "author", "source", "created_time", "text",
+)
+
+# Free-text columns read as strings instead of letting read_csv infer them.
+_TEXT_COLS = (
+    "content", "text", "dimensions", "subthemes", "subs_sentiment",
+    "subs_evidences", "author", "source",
+)
+
+
+# Shared read-only stand-in for missing/unparseable JSON maps (no per-row {}).
+_EMPTY_MAP = MappingProxyType({})
+
+_NON_ALNUM_RE = re.compile(r"[^a-zA-Z0-9]+")
+
+
+@lru_cache(maxsize=2048)
 def slugify(name: str) -> str:
-    # Convert label to safe lowercase slug for filenames.
-    name = name.strip()
-    slug = re.sub(r"[^a-zA-Z0-9]+", "_", name)
-    slug = re.sub(r"_+", "_", slug).strip("_")
+    # Convert label to safe lowercase slug for filenames (pure; memoized across calls).
+    # "_" is itself non-alphanumeric, so one pass already collapses runs of it
+    slug = _NON_ALNUM_RE.sub("_", name.strip()).strip("_")
     return slug.lower() or "item"
 
 
+@lru_cache(maxsize=4096)
+def _parse_json(s: str):
+    # orjson first (C parser); stdlib json for anything it rejects (e.g. NaN literals).
+    if orjson is not None:
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            pass
+    try:
+        return json.loads(s)
+    except Exception:
+        return None
+
+
 def safe_json_loads(s):
     # Safely parse JSON string; return None on failure.
+    # Parses are memoized, so the returned objects are shared: treat them as read-only.
     if pd.isna(s) or not isinstance(s, str):
         return None
     s = s.strip()
     if not s:
         return None
-    try:
-        return json.loads(s)
-    except Exception:
-        return None
+    return _parse_json(s)
 
 
-def aggregate_by_subtheme(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
-    # Group comments by subtheme and build stats + examples.
-    agg: Dict[str, Dict[str, Any]] = {}
+def _mean_or_zero(values: List[float]) -> float:
+    return sum(values) / len(values) if values else 0.0
 
-    for _, row in df.iterrows():
-        body = (row.get("content") or "").strip() or (row.get("text") or "").strip()
-        created_time = str(row.get("created_time", ""))
-        source = str(row.get("source", ""))
-        confidence = row.get("confidence", None)
 
-        dims_raw = row.get("dimensions")
-        subs_raw = row.get("subthemes")
-        subs_sent_raw = row.get("subs_sentiment")
-        subs_evid_raw = row.get("subs_evidences")
-
-        if pd.isna(subs_raw) or not str(subs_raw).strip():
-            continue
-
-        subthemes_list = [s.strip() for s in str(subs_raw).split("|") if s.strip()]
+def _confidence_values(df: pd.DataFrame) -> List[float]:
+    # Confidence column as floats, NaN where missing or non-numeric. Text cells
+    # never count (even "0.9"), matching the old per-row isinstance check.
+    if "confidence" not in df.columns:
+        return [float("nan")] * len(df)
+    conf = df["confidence"]
+    if not pd.api.types.is_numeric_dtype(conf):
+        try:
+            conf = conf.mask(conf.str.len().notna())  # .str yields NaN for non-str cells
+        except AttributeError:
+            pass  # no strings in the column at all
+    return pd.to_numeric(conf, errors="coerce").astype("float64").tolist()
+
+
+def _collect_mentions(df: pd.DataFrame, max_examples: int | None):
+    # One flat record per (row, subtheme) mention with positive/negative sentiment,
+    # plus example dicts per subtheme. Runs on the whole frame or on one row shard.
+    subs_out: List[str] = []
+    sents_out: List[str] = []
+    confs_out: List[float] = []
+    dims_out: List[str | None] = []
+    examples_of: Dict[str, List[Dict[str, Any]]] = {}
+    kept_per_pair: Counter = Counter()
+
+    # Drop rows without subthemes up front and split the rest in one vectorized pass.
+    subs_str = df["subthemes"].astype(str)
+    keep = (df["subthemes"].notna() & subs_str.str.strip().ne("")).to_numpy(dtype=bool)
+    df = df.loc[keep]
+    subs_lists = subs_str[keep].str.split("|").map(lambda parts: [s.strip() for s in parts if s.strip()])
+
+    # Pull each column out once and walk them in lockstep (no per-row Series).
+    def col(name: str, default=None):
+        return df[name].to_numpy() if name in df.columns else [default] * len(df)
+
+    def str_col(name: str):
+        # one C-level cast instead of str() per row; NumPy's object->str cast
+        # applies str() semantics (None -> "None", NaN -> "nan") unlike pandas' astype(str)
+        return df[name].to_numpy(dtype=object).astype(str).tolist() if name in df.columns else [""] * len(df)
+
+    def per_unique(name: str, fn, missing):
+        # apply fn to each distinct value once (duplicates share the result);
+        # NA cells get missing(raw value)
+        if name not in df.columns:
+            return [missing(None)] * len(df)
+        codes, uniques = pd.factorize(df[name])
+        parsed = [fn(u) for u in uniques]
+        if (codes >= 0).all():
+            return [parsed[c] for c in codes.tolist()]
+        raw = df[name].to_numpy()
+        return [parsed[c] if c >= 0 else missing(raw[i]) for i, c in enumerate(codes.tolist())]
+
+    def json_col(name: str):
+        return per_unique(name, safe_json_loads, lambda _: None)
+
+    def split_dims(dims_raw):
+        return [d.strip() for d in str(dims_raw).split("|")] if dims_raw else []
+
+    def bodies():
+        # load_df's raw_text is already content-or-text, stripped; reuse it vectorized
+        if "raw_text" in df.columns:
+            return df["raw_text"].str.slice(0, 1000).tolist()
+        return [
+            ((content or "").strip() or (text or "").strip())[:1000]
+            for content, text in zip(col("content"), col("text"))
+        ]
+
+    rows = zip(
+        bodies(), str_col("created_time"), str_col("source"), _confidence_values(df),
+        per_unique("dimensions", split_dims, split_dims), subs_lists.to_numpy(),
+        json_col("subs_sentiment"), json_col("subs_evidences"),
+    )
+    for body, created_time, source, confidence, dims_list, subthemes_list, sent_map, evid_map in rows:
         if not subthemes_list:
             continue
 
-        dims_list = [d.strip() for d in str(dims_raw).split("|")] if dims_raw else []
+        # dims_list may be shared between rows with the same dimensions string
         if dims_list and len(dims_list) < len(subthemes_list):
-            dims_list += [dims_list[-1]] * (len(subthemes_list) - len(dims_list))
+            dims_list = dims_list + [dims_list[-1]] * (len(subthemes_list) - len(dims_list))
 
-        sent_map = safe_json_loads(subs_sent_raw) or {}
-        evid_map = safe_json_loads(subs_evid_raw) or {}
+        sent_map = sent_map or _EMPTY_MAP
+        evid_map = evid_map or _EMPTY_MAP
 
         for i, sub in enumerate(subthemes_list):
             sent = sent_map.get(sub)
@@ -82,57 +196,139 @@ def aggregate_by_subtheme(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
             else:
                 ev = ""
 
-            if sub not in agg:
-                agg[sub] = {
-                    "total_mentions": 0,
-                    "sentiment_counts": Counter(),
-                    "confidences": [],
-                    "dimensions_counter": Counter(),
-                    "examples": [],
-                }
-
-            item = agg[sub]
-            item["total_mentions"] += 1
-            item["sentiment_counts"][sent] += 1
-
-            if isinstance(confidence, (int, float)):
-                item["confidences"].append(float(confidence))
+            # One flat record per mention; stats are grouped after the loop.
+            subs_out.append(sub)
+            sents_out.append(sent)
+            confs_out.append(confidence)
+            dims_out.append(dim or None)
 
-            if dim:
-                item["dimensions_counter"][dim] += 1
+            if max_examples is not None:
+                if kept_per_pair[sub, dim or ""] >= max_examples:
+                    continue
+                kept_per_pair[sub, dim or ""] += 1
 
-            item["examples"].append(
+            examples_of.setdefault(sub, []).append(
                 {
                     "sentiment": sent,
                     "dimension": dim or "",
                     "subtheme": sub,
-                    "confidence": float(confidence) if isinstance(confidence, (int, float)) else None,
+                    "confidence": confidence if confidence == confidence else None,
                     "created_time": created_time,
                     "source": source,
                     "evidence": ev,
-                    "content": body[:1000],
+                    "content": body,
                 }
             )
 
+    return subs_out, sents_out, confs_out, dims_out, examples_of
+
+
+def aggregate_by_subtheme(df: pd.DataFrame, max_examples: int | None = None) -> Dict[str, Dict[str, Any]]:
+    # Group comments by subtheme and build stats + examples.
+    # max_examples caps examples per (subtheme, dimension) pair, which still keeps
+    # the first N examples of every subtheme and of every dimension.
+    if "subthemes" not in df.columns:
+        return {}
+
+    workers = min(os.cpu_count() or 1, AGG_WORKERS)
+    if len(df) >= AGG_POOL_MIN_ROWS and workers > 1:
+        # Rows are independent: collect mentions per contiguous shard in worker
+        # processes, then concatenate in shard order (same order as one pass).
+        bounds = np.linspace(0, len(df), workers + 1, dtype=int)
+        shards = [(df.iloc[a:b], max_examples) for a, b in zip(bounds[:-1], bounds[1:])]
+        with mp.Pool(workers) as pool:
+            parts = pool.starmap(_collect_mentions, shards)
+    else:
+        parts = [_collect_mentions(df, max_examples)]
+
+    subs_out = [x for part in parts for x in part[0]]
+    sents_out = [x for part in parts for x in part[1]]
+    confs_out = [x for part in parts for x in part[2]]
+    dims_out = [x for part in parts for x in part[3]]
+    examples_of: Dict[str, List[Dict[str, Any]]] = {}
+    for part in parts:
+        for sub, exs in part[4].items():
+            examples_of.setdefault(sub, []).extend(exs)
+    if max_examples is not None and len(parts) > 1:
+        # each shard kept its own first N per pair; keep the global first N
+        for sub, exs in examples_of.items():
+            kept: Counter = Counter()
+            capped = []
+            for ex in exs:
+                if kept[ex["dimension"]] < max_examples:
+                    kept[ex["dimension"]] += 1
+                    capped.append(ex)
+            examples_of[sub] = capped
+
+    if not subs_out:
+        return {}
+
+    tmp = pd.DataFrame({"sub": subs_out, "sent": sents_out, "conf": confs_out, "dim": dims_out})
+    by_sub = tmp.groupby("sub", sort=False)
+    totals = by_sub.size()
+    # plain sum/len per group (not pandas' compensated mean) so averages match the
+    # values previously written to the summaries bit for bit
+    avg_conf = by_sub["conf"].agg(lambda c: _mean_or_zero(c.dropna().tolist()))
+
+    # (sub, key) counts in first-seen order, folded into per-subtheme dicts
+    sentiment_counts: Dict[str, Dict[str, int]] = {}
+    for (sub, sent), n in tmp.groupby(["sub", "sent"], sort=False).size().items():
+        sentiment_counts.setdefault(sub, {})[sent] = int(n)
+    dimensions_counter: Dict[str, Dict[str, int]] = {}
+    for (sub, dim), n in tmp.groupby(["sub", "dim"], sort=False).size().items():
+        dimensions_counter.setdefault(sub, {})[dim] = int(n)
+
+    # Per-dimension stats of each subtheme, so dimension summaries do not
+    # depend on every mention being kept as an example.
+    breakdown: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for (sub, dim, sent), n in tmp.groupby(["sub", "dim", "sent"], sort=False).size().items():
+        entry = breakdown.setdefault(sub, {}).setdefault(dim, {"sentiment_counts": {}, "confidences": []})
+        entry["sentiment_counts"][sent] = int(n)
+    for (sub, dim), confs in tmp[tmp["conf"].notna()].groupby(["sub", "dim"], sort=False)["conf"]:
+        breakdown[sub][dim]["confidences"] = confs.tolist()
+
     result: Dict[str, Dict[str, Any]] = {}
-    for sub, item in agg.items():
-        confs = item["confidences"]
-        avg_conf = sum(confs) / len(confs) if confs else 0.0
+    for sub, total in totals.items():
         result[sub] = {
-            "total_mentions": item["total_mentions"],
-            "sentiment_counts": dict(item["sentiment_counts"]),
-            "avg_confidence": avg_conf,
-            "dimensions_counter": dict(item["dimensions_counter"]),
-            "examples": item["examples"],
+            "total_mentions": int(total),
+            "sentiment_counts": sentiment_counts.get(sub, {}),
+            "avg_confidence": float(avg_conf[sub]),
+            "dimensions_counter": dimensions_counter.get(sub, {}),
+            "dimension_breakdown": breakdown.get(sub, {}),
+            "examples": examples_of.get(sub, []),
         }
     return result
 
 
 def aggregate_dimensions_from_sub_agg(sub_agg: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
     # Build dimension-level stats from subtheme-level aggregation.
+    # Stats come from each subtheme's dimension_breakdown when present (examples
+    # may be capped); otherwise they are counted from the examples themselves.
+    # Dimension examples are always rebuilt in their own shape (no "dimension" key).
     dim_agg: Dict[str, Dict[str, Any]] = {}
 
+    def item_for(dim: str) -> Dict[str, Any]:
+        if dim not in dim_agg:
+            dim_agg[dim] = {
+                "total_mentions": 0,
+                "sentiment_counts": Counter(),
+                "confidences": [],
+                "subthemes_counter": Counter(),
+                "examples": [],
+            }
+        return dim_agg[dim]
+
     for sub, data in sub_agg.items():
+        breakdown = data.get("dimension_breakdown")
+        if breakdown is not None:
+            for dim, part in breakdown.items():
+                item = item_for(dim)
+                n = sum(part["sentiment_counts"].values())
+                item["total_mentions"] += n
+                item["sentiment_counts"].update(part["sentiment_counts"])
+                item["confidences"].extend(part["confidences"])
+                item["subthemes_counter"][sub] += n
+
         for ex in data["examples"]:
             dim = ex.get("dimension") or ""
             if not dim:
@@ -141,22 +337,14 @@ def aggregate_dimensions_from_sub_agg(sub_agg: Dict[str, Dict[str, Any]]) -> Dic
             if sent not in ("positive", "negative"):
                 continue
 
-            if dim not in dim_agg:
-                dim_agg[dim] = {
-                    "total_mentions": 0,
-                    "sentiment_counts": Counter(),
-                    "confidences": [],
-                    "subthemes_counter": Counter(),
-                    "examples": [],
-                }
-
-            item = dim_agg[dim]
-            item["total_mentions"] += 1
-            item["sentiment_counts"][sent] += 1
+            item = item_for(dim)
             conf = ex.get("confidence")
-            if isinstance(conf, (int, float)):
-                item["confidences"].append(float(conf))
-            item["subthemes_counter"][sub] += 1
+            if breakdown is None:
+                item["total_mentions"] += 1
+                item["sentiment_counts"][sent] += 1
+                if isinstance(conf, (int, float)):
+                    item["confidences"].append(float(conf))
+                item["subthemes_counter"][sub] += 1
 
             item["examples"].append(
                 {
@@ -176,82 +364,213 @@ def aggregate_dimensions_from_sub_agg(sub_agg: Dict[str, Dict[str, Any]]) -> Dic
         avg_conf = sum(confs) / len(confs) if confs else 0.0
         result[dim] = {
             "total_mentions": item["total_mentions"],
-            "sentiment_counts": dict(item["sentiment_counts"]),
+            "sentiment_counts": item["sentiment_counts"],
             "avg_confidence": avg_conf,
-            "subthemes_counter": dict(item["subthemes_counter"]),
+            "subthemes_counter": item["subthemes_counter"],
             "examples": item["examples"],
         }
     return result
 
 
 def load_df(csv_path: Path) -> pd.DataFrame:
-    # Read CSV with fallback encodings and ensure required columns exist.
-    for enc in ("utf-8-sig", "utf-8", "cp1252"):
+    # Read the required columns with fallback encodings and ensure they all exist.
+    # The encoding sniffed from the leading bytes goes first so the common
+    # case parses the file once.
+    try:
+        with open(csv_path, "rb") as f:
+            head = f.read(_CSV_PEEK_BYTES)
+    except OSError:
+        head = b""
+    encodings = ["utf-8-sig", "utf-8", "cp1252"]
+    encodings.insert(0, encodings.pop(encodings.index(_sniff_encoding(head, fallback="cp1252"))))
+    for enc in encodings:
         try:
-            df = pd.read_csv(csv_path, encoding=enc, on_bad_lines="skip")
+            df = pd.read_csv(
+                csv_path,
+                encoding=enc,
+                on_bad_lines="skip",
+                dtype={c: _TEXT_DTYPE for c in _TEXT_COLS},
+                usecols=lambda c: str(c).strip().lstrip("\ufeff") in _REQUIRED_COLS,
+            )
             break
         except Exception:
             continue
     else:
         raise RuntimeError(f"Failed to read CSV: {csv_path}")
 
-    df.columns = [
-        str(c).encode("utf-8", "ignore").decode("utf-8").strip().lstrip("\ufeff")
-        for c in df.columns
-    ]
-
-    required = [
-        "content",
-        "dimensions",
-        "subthemes",
-        "subs_sentiment",
-        "confidence",
-        "subs_evidences",
-        "author",
-        "source",
-        "created_time",
-        "text",
-    ]
-    for col in required:
+    # object dtype (not Arrow strings) so names with lone surrogates still reach
+    # the encode(..., "ignore") step that drops them
+    df.columns = (
+        pd.Index(df.columns.to_numpy(dtype=object).astype(str), dtype=object)
+        .str.encode("utf-8", "ignore")
+        .str.decode("utf-8")
+        .str.strip()
+        .str.lstrip("\ufeff")
+    )
+
+    for col in _REQUIRED_COLS:
         if col not in df.columns:
             df[col] = None
 
-    for col in required:
+    for col in _REQUIRED_COLS:
         df[col] = df[col].fillna("")
 
-    df["raw_text"] = df.apply(
-        lambda r: (r.get("content") or "").strip() or (r.get("text") or "").strip(),
-        axis=1,
-    )
+    # content if non-blank, else text (both stripped)
+    content = df["content"].astype(str).str.strip()
+    text = df["text"].astype(str).str.strip()
+    df["raw_text"] = content.where(content.ne(""), text)
     return df
 
 
-def run_pipeline(
-    args,
-    build_client_fn: Callable[[], Any],
-    call_llm_fn: Callable[[Any, str, str], Dict[str, Any]],
-    quota_check_fn: Callable[[Exception], bool],
-) -> None:
-    # Run subtheme + dimension summary pipeline using parsed args and injected LLM helpers.
-    overwrite_value = str(args.overwrite).strip().lower()
+# Non-str keys (e.g. int counts) and numpy scalars are common in the stats
+# dicts; handle them in orjson rather than dropping to stdlib json.
+_ORJSON_WRITE_OPTS = (
+    orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    if orjson is not None
+    else 0
+)
+
+
+def _write_json(path: Path, obj: Any) -> None:
+    # Pretty JSON (2-space indent, non-ASCII kept) written to a temp file and
+    # swapped in, so a crash never leaves a half-written summary.
+    data = None
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, option=_ORJSON_WRITE_OPTS)
+        except TypeError:
+            pass  # anything orjson can't encode: let json handle it
+    if data is None:
+        data = json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _agg_cache_key(csv_path: Path, max_examples: int | None) -> str:
+    # File identity (size + mtime, no re-read of the CSV) plus this module's own
+    # source, so any change to the aggregation code invalidates old checkpoints.
+    st = csv_path.stat()
+    h = hashlib.sha1(f"{csv_path.resolve()}|{st.st_size}|{st.st_mtime_ns}|{max_examples}".encode())
+    h.update(Path(__file__).read_bytes())
+    return h.hexdigest()[:12]
+
+
+def _load_sub_agg(csv_path: Path, max_examples: int | None, cache_dir: Path):
+    # (row count, subtheme aggregation) for the CSV. With SUBTHE_AGG_CACHE=1 it is
+    # checkpointed as JSON in cache_dir, so reruns (e.g. --overwrite of a few
+    # labels) skip parsing and aggregation. Off by default.
+    if os.getenv("SUBTHE_AGG_CACHE", "0") != "1":
+        df = load_df(csv_path)
+        return len(df), aggregate_by_subtheme(df, max_examples=max_examples)
+
+    cache_path = cache_dir / f".agg_cache_{_agg_cache_key(csv_path, max_examples)}.json"
+    if cache_path.exists():
+        try:
+            raw = cache_path.read_bytes()
+            cached = orjson.loads(raw) if orjson is not None else json.loads(raw)
+            print(f"[info] Reusing aggregation checkpoint {cache_path.name}")
+            return cached["n_rows"], cached["sub_agg"]
+        except Exception:
+            pass  # unreadable checkpoint: rebuild it
+
+    df = load_df(csv_path)
+    sub_agg = aggregate_by_subtheme(df, max_examples=max_examples)
+    for stale in cache_dir.glob(".agg_cache_*"):
+        stale.unlink(missing_ok=True)
+    payload = {"n_rows": len(df), "sub_agg": sub_agg}
+    if orjson is not None:
+        data = orjson.dumps(payload)
+    else:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    tmp = cache_path.with_suffix(".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, cache_path)
+    return len(df), sub_agg
+
+
+def _run_labels(labels: List[str], worker: Callable[[int, str], bool], workers: int) -> bool:
+    # Run worker(idx, label) for each label on a bounded thread pool (LLM calls
+    # are network-bound). Stops early and returns False once a worker reports
+    # quota/rate-limit exhaustion; if a worker raises, the error is re-raised.
+    # Either way queued labels are cancelled, so no further LLM calls are made.
+    stop = threading.Event()
+
+    def run(idx: int, label: str) -> bool:
+        if stop.is_set():
+            return True
+        try:
+            ok = worker(idx, label)
+        except BaseException:
+            stop.set()
+            raise
+        if ok is False:
+            stop.set()
+        return ok
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = [ex.submit(run, idx, label) for idx, label in enumerate(labels, start=1)]
+        for fut in as_completed(futures):
+            try:
+                ok = fut.result()
+            except BaseException:
+                stop.set()
+                ex.shutdown(wait=False, cancel_futures=True)
+                raise
+            if ok is False:
+                ex.shutdown(wait=False, cancel_futures=True)
+                return False
+    return True
+
+
+def overwrite_rule(overwrite: Any) -> Callable[[str], bool]:
+    # --overwrite value -> predicate on label names. "all" overwrites everything;
+    # plain tokens select labels exactly (by label or file slug, one set lookup);
+    # only tokens with "*" are wildcard patterns matched against label and slug.
+    overwrite_value = str(overwrite).strip().lower()
     overwrite_all = overwrite_value == "all"
-    overwrite_list = set()
+    overwrite_exact = set()
+    overwrite_patterns = []
 
     if not overwrite_all and overwrite_value not in ("none", "", "null"):
-        overwrite_list = {
-            token.strip().lower()
-            for token in str(args.overwrite).split(",")
-            if token.strip()
-        }
+        for token in overwrite_value.split(","):
+            token = token.strip()
+            if not token:
+                continue
+            if "*" in token:
+                overwrite_patterns.append(token)
+            else:
+                overwrite_exact.add(slugify(token))
 
     def should_overwrite(name: str) -> bool:
         # Decide if this label should be overwritten.
         if overwrite_all:
             return True
-        if not overwrite_list:
+        slug = slugify(name)
+        if slug in overwrite_exact:
+            return True
+        if not overwrite_patterns:
             return False
         lname = name.lower()
-        return any(key in lname for key in overwrite_list)
+        return any(fnmatchcase(lname, p) or fnmatchcase(slug, p) for p in overwrite_patterns)
+
+    return should_overwrite
+
+
+# Output-token caps per summary kind (the schemas run ~400-600 tokens); the
+# overall report keeps the LLM module's larger default.
+SUB_MAX_TOKENS = 700
+DIM_MAX_TOKENS = 900
+
+
+def run_pipeline(
+    args,
+    build_client_fn: Callable[[], Any],
+    call_llm_fn: Callable[..., Dict[str, Any]],
+    quota_check_fn: Callable[[Exception], bool],
+) -> None:
+    # Run subtheme + dimension summary pipeline using parsed args and injected LLM helpers.
+    should_overwrite = overwrite_rule(args.overwrite)
 
     csv_path = Path(args.csv)
     sub_out_dir = Path(args.outdir)
@@ -268,10 +587,9 @@ def run_pipeline(
     print(f"[cfg] MODEL       = {args.model}")
     print(f"[cfg] OVERWRITE   = {args.overwrite}")
 
-    df = load_df(csv_path)
-    print(f"[info] Loaded {len(df)} rows from {csv_path}")
+    n_rows, sub_agg = _load_sub_agg(csv_path, args.max_examples, sub_out_dir)
+    print(f"[info] Loaded {n_rows} rows from {csv_path}")
 
-    sub_agg = aggregate_by_subtheme(df)
     all_subthemes = sorted(sub_agg.keys())
     print(f"[info] Found {len(all_subthemes)} subthemes with positive/negative data")
 
@@ -283,17 +601,19 @@ def run_pipeline(
         )
 
     client = build_client_fn()
+    workers = max(1, int(getattr(args, "workers", 1) or 1))
 
     # Subtheme summaries
     from subthe_dimen_llm import build_prompt_for_subtheme, build_prompt_for_dimension  # lazy import to avoid cycle
 
-    for idx, sub in enumerate(all_subthemes, start=1):
+    def process_sub(idx: int, sub: str) -> bool:
+        # Summarise one subtheme; False means quota/rate limit was hit.
         slug = slugify(sub)
         out_path = sub_out_dir / f"subtheme_{slug}.json"
 
         if out_path.exists() and not should_overwrite(sub):
             print(f"[{idx}/{len(all_subthemes)}] (subtheme) {sub} -> skip (exists, overwrite=False)")
-            continue
+            return True
 
         data = sub_agg[sub]
         stats = {
@@ -315,13 +635,13 @@ def run_pipeline(
         prompt = build_prompt_for_subtheme(sub, stats, examples)
 
         try:
-            json_obj = call_llm_fn(client, args.model, prompt)
+            json_obj = call_llm_fn(client, args.model, prompt, max_tokens=SUB_MAX_TOKENS)
         except Exception as e:
             print(f"[error] LLM failed for subtheme '{sub}': {e}")
 
             if quota_check_fn(e):
                 print("[fatal] Quota or rate-limit issue detected. Please refresh your API key or wait.")
-                return
+                return False
 
             json_obj = {
                 "subtheme": sub,
@@ -338,9 +658,12 @@ def run_pipeline(
                 "recommendations": [],
             }
 
-        with out_path.open("w", encoding="utf-8") as f:
-            json.dump(json_obj, f, ensure_ascii=False, indent=2)
+        _write_json(out_path, json_obj)
         print(f"    -> wrote {out_path}")
+        return True
+
+    if not _run_labels(all_subthemes, process_sub, workers):
+        return
 
     # Dimension summaries (optional)
     if dim_out_dir is not None:
@@ -348,13 +671,14 @@ def run_pipeline(
         all_dims = sorted(dim_agg.keys())
         print(f"[info] Found {len(all_dims)} dimensions with positive/negative data")
 
-        for idx, dim in enumerate(all_dims, start=1):
+        def process_dim(idx: int, dim: str) -> bool:
+            # Summarise one dimension; False means quota/rate limit was hit.
             slug = slugify(dim)
             out_path = dim_out_dir / f"dimension_{slug}.json"
 
             if out_path.exists() and not should_overwrite(dim):
                 print(f"[{idx}/{len(all_dims)}] (dimension) {dim} -> skip (exists, overwrite=False)")
-                continue
+                return True
 
             data = dim_agg[dim]
             stats = {
@@ -375,18 +699,15 @@ def run_pipeline(
 
             prompt = build_prompt_for_dimension(dim, stats, examples)
 
-            top_subthemes_sorted = sorted(
-                stats["subthemes_counter"].items(),
-                key=lambda x: x[1],
-                reverse=True,
-            )
+            # Every associated subtheme is written out, so take the whole
+            # most_common() ordering (same stable count-desc order as sorted).
             top_subthemes_list = [
                 {"subtheme": name, "count": count}
-                for name, count in top_subthemes_sorted
+                for name, count in stats["subthemes_counter"].most_common()
             ]
 
             try:
-                json_obj = call_llm_fn(client, args.model, prompt)
+                json_obj = call_llm_fn(client, args.model, prompt, max_tokens=DIM_MAX_TOKENS)
                 json_obj["sentiment_snapshot"] = {
                     "positive": stats["sentiment_counts"]["positive"],
                     "negative": stats["sentiment_counts"]["negative"],
@@ -398,7 +719,7 @@ def run_pipeline(
 
                 if quota_check_fn(e):
                     print("[fatal] Quota or rate-limit issue detected. Please refresh your API key or wait.")
-                    return
+                    return False
 
                 json_obj = {
                     "dimension": dim,
@@ -414,8 +735,11 @@ def run_pipeline(
                     "recommendations": [],
                 }
 
-            with out_path.open("w", encoding="utf-8") as f:
-                json.dump(json_obj, f, ensure_ascii=False, indent=2)
+            _write_json(out_path, json_obj)
             print(f"    -> wrote {out_path}")
+            return True
+
+        if not _run_labels(all_dims, process_dim, workers):
+            return
 
     print("[done] All subthemes processed; dimensions summarised as requested.")
@@ -6,9 +6,15 @@
 
 from __future__ import annotations
 
+import hashlib
 import os
 import json
+import random
 import re
+import tempfile
+import threading
+import time
+from pathlib import Path
 from typing import Any, Dict, List
 
 from openai import OpenAI
@@ -16,23 +22,83 @@ from openai import OpenAI
 DEFAULT_MODEL = "deepseek/deepseek-chat-v3.1:free"
 DEFAULT_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 API_KEY_ENV = "OPENROUTER_API_KEY"
+# Optional on-disk cache of parsed LLM responses, keyed by sha256 of the request.
+# Off unless LLM_CACHE_DIR is set, so --overwrite still regenerates by default.
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "").strip() or None
+
+# Generation settings for summary calls; part of the cache key.
+# GEN_MAX_TOKENS is the default cap (the overall report needs it); callers with a
+# smaller schema pass their own max_tokens (see SUB_/DIM_MAX_TOKENS in subthe_dimen_core).
+GEN_MAX_TOKENS = 1200
+GEN_TEMPERATURE = 0.35
+# Ask the endpoint for a JSON object (OpenAI-style response_format); set
+# LLM_JSON_MODE=0 for models/providers that reject the parameter.
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "1") == "1"
+
+
+def _json_mode_kwargs() -> Dict[str, Any]:
+    return {"response_format": {"type": "json_object"}} if LLM_JSON_MODE else {}
+
+
+_HARD_QUOTA_KEYWORDS = (
+    "insufficient_quota",
+    "insufficient quota",
+    "usage limit",
+    "402",
+    "billing_hard_limit",
+    "billing_soft_limit",
+)
+_QUOTA_KEYWORDS = _HARD_QUOTA_KEYWORDS + ("rate limit", "too many requests", "429")
+# One case-insensitive scan per message instead of a substring test per keyword.
+_QUOTA_RE = re.compile("|".join(map(re.escape, _QUOTA_KEYWORDS)), re.IGNORECASE)
+_HARD_QUOTA_RE = re.compile("|".join(map(re.escape, _HARD_QUOTA_KEYWORDS)), re.IGNORECASE)
 
 
 def is_quota_or_ratelimit_error(err: Exception) -> bool:
     # Check if error looks like quota / rate limit.
-    msg = str(err).lower()
-    keywords = [
-        "insufficient_quota",
-        "insufficient quota",
-        "usage limit",
-        "rate limit",
-        "too many requests",
-        "429",
-        "402",
-        "billing_hard_limit",
-        "billing_soft_limit",
-    ]
-    return any(k in msg for k in keywords)
+    return _QUOTA_RE.search(str(err)) is not None
+
+
+def is_hard_quota_error(err: Exception) -> bool:
+    # Exhausted quota / billing: retrying cannot help (unlike a transient 429).
+    return _HARD_QUOTA_RE.search(str(err)) is not None
+
+
+# Retry transient failures (429s, timeouts, non-JSON replies) with exponential
+# backoff + jitter; optional requests-per-minute throttle shared by all threads.
+LLM_MAX_ATTEMPTS = 3
+LLM_BACKOFF_BASE = 2.0
+LLM_BACKOFF_MAX = 60.0
+LLM_RPM = float(os.getenv("LLM_RPM", "0") or 0)
+
+_throttle_lock = threading.Lock()
+_next_slot = [0.0]
+
+
+def _throttle(sleep_fn=time.sleep) -> None:
+    # Space request starts at least 60/LLM_RPM seconds apart (no-op when LLM_RPM <= 0).
+    if LLM_RPM <= 0:
+        return
+    with _throttle_lock:
+        now = time.monotonic()
+        start = max(now, _next_slot[0])
+        _next_slot[0] = start + 60.0 / LLM_RPM
+    if start > now:
+        sleep_fn(start - now)
+
+
+def call_with_backoff(call_fn, client, model: str, prompt, sleep_fn=time.sleep):
+    # Run call_fn with retries; hard quota errors are raised immediately.
+    for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+        _throttle(sleep_fn)
+        try:
+            return call_fn(client, model, prompt)
+        except Exception as e:
+            if is_hard_quota_error(e) or attempt == LLM_MAX_ATTEMPTS:
+                raise
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** (attempt - 1)))
+            print(f"[warn] LLM retry {attempt}/{LLM_MAX_ATTEMPTS - 1}: {e}; sleep {delay:.1f}s")
+            sleep_fn(delay)
 
 
 def build_client():
@@ -44,6 +110,64 @@ def build_client():
     return client
 
 
+_JSON_DECODER = json.JSONDecoder()
+
+try:  # optional: tolerant parser for malformed LLM JSON
+    import json_repair as _json_repair
+except ImportError:  # pragma: no cover - optional dependency
+    _json_repair = None
+
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_BARE_WORD_RE = re.compile(r"[A-Za-z_]+")
+_CLOSE_AHEAD_RE = re.compile(r"\s*[}\]]")
+
+
+def _strip_json_noise(text: str) -> str:
+    # Drop trailing commas and // comments and map Python literals, leaving
+    # string contents untouched.
+    out: List[str] = []
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if ch == '"':
+            j = i + 1
+            while j < n and text[j] != '"':
+                j += 2 if text[j] == "\\" else 1
+            out.append(text[i:j + 1])
+            i = j + 1
+        elif ch == "," and _CLOSE_AHEAD_RE.match(text, i + 1):
+            i += 1
+        elif ch == "/" and text.startswith("//", i):
+            nl = text.find("\n", i)
+            i = n if nl == -1 else nl
+        elif ch.isascii() and (ch.isalpha() or ch == "_"):
+            # ASCII-only, like _BARE_WORD_RE; other letters fall through as-is
+            m = _BARE_WORD_RE.match(text, i)
+            word = m.group(0)
+            out.append(_PY_LITERALS.get(word, word))
+            i = m.end()
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+def _repair_json(json_str: str):
+    # Best-effort local fix for near-JSON; returns a dict or None.
+    if _json_repair is not None:
+        try:
+            obj = _json_repair.loads(json_str)
+            if isinstance(obj, dict) and obj:
+                return obj
+        except Exception:
+            pass
+    try:
+        obj = json.loads(_strip_json_noise(json_str))
+    except json.JSONDecodeError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
 def extract_first_json(text: str) -> str:
     # Extract first complete JSON object from LLM text.
     text = text.strip()
@@ -57,6 +181,14 @@ def extract_first_json(text: str) -> str:
     if start == -1:
         raise ValueError("No '{' found in response; cannot extract JSON.")
 
+    # Common case: a valid object starts at the first brace; the C decoder finds its end.
+    try:
+        _, end = _JSON_DECODER.raw_decode(text, start)
+        return text[start:end]
+    except ValueError:
+        pass
+
+    # Fallback for almost-JSON (e.g. trailing commas): balanced-brace scan.
     depth = 0
     in_string = False
     escape = False
@@ -87,15 +219,154 @@ def extract_first_json(text: str) -> str:
     return text[start : end + 1]
 
 
-def call_deepseek_json(client, model: str, prompt: str) -> Dict[str, Any]:
+def build_messages(prompt) -> List[Dict[str, str]]:
+    # Accept a plain prompt string or a ready-made chat message list.
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return list(prompt)
+
+
+STRICT_JSON_REMINDER = (
+    "Reply with the JSON object only: start with '{' and add no text before or after it."
+)
+
+
+def _json_head_state(text: str):
+    # Inspect the start of a partial response.
+    # Returns True if it starts like JSON, False if it clearly does not,
+    # None if there is not enough text yet to decide.
+    head = text.lstrip()
+    if not head:
+        return None
+    if head.startswith("{"):
+        return True
+    if head.startswith("`"):
+        body = head.lstrip("`")
+        if body[:4].lower() == "json":
+            body = body[4:]
+        elif "json".startswith(body.lower()):
+            return None
+        body = body.lstrip()
+        if not body:
+            return None
+        return body.startswith("{")
+    return False
+
+
+def stream_completion(client, **kwargs):
+    # Stream a chat completion and stop as soon as the output is clearly not JSON.
+    # Returns (text, looks_like_json); text is partial when the stream was aborted.
+    stream = client.chat.completions.create(stream=True, **kwargs)
+    parts: List[str] = []
+    state = None
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if not delta:
+                continue
+            parts.append(delta)
+            if state is None:
+                state = _json_head_state("".join(parts))
+                if state is False:
+                    break
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return "".join(parts), state is not False
+
+
+def _llm_cache_path(model: str, prompt, max_tokens: int = GEN_MAX_TOKENS) -> Path | None:
+    if not LLM_CACHE_DIR:
+        return None
+    # everything that shapes the response goes into the key, so changing the
+    # generation settings does not serve stale summaries
+    key_src = json.dumps(
+        {
+            "model": model,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": GEN_TEMPERATURE,
+            "json_mode": LLM_JSON_MODE,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    key = hashlib.sha256(key_src.encode("utf-8")).hexdigest()
+    return Path(LLM_CACHE_DIR) / f"{key}.json"
+
+
+def call_deepseek_json(
+    client, model: str, prompt, retry: bool = True, max_tokens: int | None = None
+) -> Dict[str, Any]:
+    # Cached (see LLM_CACHE_DIR), retrying wrapper around _call_deepseek_json.
+    # retry=False makes a single (throttled) attempt, for callers that run
+    # their own retry loop (overall_sr) so retries are not nested.
+    # max_tokens defaults to GEN_MAX_TOKENS.
+    max_tokens = max_tokens or GEN_MAX_TOKENS
+    path = _llm_cache_path(model, prompt, max_tokens)
+    if path is not None and path.exists():
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            pass  # unreadable entry: call the model again and overwrite it
+
+    def once(client, model, prompt):
+        return _call_deepseek_json(client, model, prompt, max_tokens=max_tokens)
+
+    if retry:
+        obj = call_with_backoff(once, client, model, prompt)
+    else:
+        _throttle()
+        obj = once(client, model, prompt)
+
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    return obj
+
+
+def _call_deepseek_json(client, model: str, prompt, max_tokens: int = GEN_MAX_TOKENS) -> Dict[str, Any]:
     # Call DeepSeek and return parsed JSON.
-    resp = client.chat.completions.create(
+    # `prompt` is either a single user prompt or a list of chat messages
+    # (e.g. a static system prefix followed by a dynamic user message).
+    # The response is streamed; if it does not start like JSON the stream is
+    # cancelled early and the request is retried once with a stricter reminder.
+    messages = build_messages(prompt)
+    text, ok = stream_completion(
+        client,
         model=model,
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=1200,
-        temperature=0.35,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=GEN_TEMPERATURE,
+        **_json_mode_kwargs(),
     )
-    text = resp.choices[0].message.content.strip()
+    if not ok:
+        print("[warn] LLM response is not JSON; retrying with strict JSON reminder.")
+        text, ok = stream_completion(
+            client,
+            model=model,
+            messages=messages + [{"role": "system", "content": STRICT_JSON_REMINDER}],
+            max_tokens=max_tokens,
+            temperature=GEN_TEMPERATURE,
+            **_json_mode_kwargs(),
+        )
+    text = text.strip()
+
+    # Fast path: decode the first JSON object in place (no extract-then-reparse).
+    start = text.find("{")
+    if start != -1:
+        try:
+            obj, _ = _JSON_DECODER.raw_decode(text, start)
+            if isinstance(obj, dict):
+                return obj
+        except ValueError:
+            pass
 
     try:
         json_str = extract_first_json(text)
@@ -108,6 +379,11 @@ def call_deepseek_json(client, model: str, prompt: str) -> Dict[str, Any]:
     try:
         return json.loads(json_str)
     except json.JSONDecodeError:
+        # Most malformed replies are trailing commas / comments / Python literals:
+        # repair locally and only pay for a second LLM round trip if that fails.
+        repaired = _repair_json(json_str)
+        if repaired is not None:
+            return repaired
         fix_prompt = f"""
             Fix the following text into valid JSON (keep all keys/values intact, only fix syntax):
 
@@ -119,50 +395,30 @@ def call_deepseek_json(client, model: str, prompt: str) -> Dict[str, Any]:
             messages=[{"role": "user", "content": fix_prompt}],
             max_tokens=800,
             temperature=0.0,
+            **_json_mode_kwargs(),
         )
         fixed_text = resp2.choices[0].message.content.strip()
         fixed_json_str = extract_first_json(fixed_text)
         return json.loads(fixed_json_str)
 
 
-def build_prompt_for_subtheme(subtheme_name: str, stats: Dict[str, Any], examples: List[Dict[str, Any]]) -> str:
-    # Prompt for one subtheme summary.
-    dim_lines = [f"- {dim}: {c}" for dim, c in stats["dimensions_counter"].items()]
-    dim_block = "\n".join(dim_lines) if dim_lines else "(no clear parent dimension)"
-
-    sent_counts = stats["sentiment_counts"]
-    sent_block = (
-        f"- positive: {sent_counts.get('positive', 0)}\n"
-        f"- negative: {sent_counts.get('negative', 0)}\n"
-    )
-
-    ex_lines = []
-    for i, ex in enumerate(examples, start=1):
-        conf_str = "n/a" if ex["confidence"] is None else f"{ex['confidence']:.2f}"
-        ex_lines.append(
-            f"{i}. [sentiment={ex['sentiment']}, dim={ex['dimension']}, conf={conf_str}] "
-            f"source={ex['source']}, time={ex['created_time']}\n"
-            f"   evidence: {ex['evidence']}\n"
-            f"   content: {ex['content']}"
-        )
-    examples_block = "\n".join(ex_lines) if ex_lines else "(no examples available)"
-
-    prompt = f"""
+# Static prompt bodies, filled with str.format_map per call ({{ }} are literal braces).
+_SUB_PROMPT_TEMPLATE = """
         You are a corporate culture analyst. Summarise the following *subtheme* based on aggregated statistics and representative examples.
 
         Subtheme name:
-        - {subtheme_name}
+        - {name}
 
         Aggregated statistics:
-        - Total mentions: {stats["total_mentions"]}
+        - Total mentions: {total_mentions}
         - Sentiment counts:
-        {sent_block.strip()}
-        - Average confidence (overall): {stats["avg_confidence"]:.3f}
+        {sent_block}
+        - Average confidence (overall): {avg_confidence:.3f}
         - Parent dimensions distribution:
-        {dim_block if dim_block else "(none)"}
+        {dim_block}
 
         Representative examples (each bullet is one real-world comment snippet):
-        {examples_block if examples_block else "(none)"}
+        {examples_block}
 
         TASK:
         1. Read the data carefully and write a concise, insightful summary of this **subtheme** in the corporate culture context.
@@ -185,9 +441,9 @@ def build_prompt_for_subtheme(subtheme_name: str, stats: Dict[str, Any], example
             "<pattern 3>"
         ],
         "sentiment_snapshot": {{
-            "positive": {sent_counts.get('positive', 0)},
-            "negative": {sent_counts.get('negative', 0)},
-            "average_confidence": {stats["avg_confidence"]:.3f}
+            "positive": {positive},
+            "negative": {negative},
+            "average_confidence": {avg_confidence:.3f}
         }},
         "typical_contexts": [
             "<how this subtheme usually appears in comments>",
@@ -208,48 +464,24 @@ def build_prompt_for_subtheme(subtheme_name: str, stats: Dict[str, Any], example
         - Do NOT fabricate numbers; use the given sentiment counts and confidence.
         - Speak as a human consultant, not an AI model.
         - Output must be valid JSON and parseable.
-        """
-    return prompt.strip()
-
-
-def build_prompt_for_dimension(dimension_name: str, stats: Dict[str, Any], examples: List[Dict[str, Any]]) -> str:
-    # Prompt for one culture dimension summary.
-    sub_lines = [f"- {sub}: {c}" for sub, c in stats["subthemes_counter"].items()]
-    sub_block = "\n".join(sub_lines) if sub_lines else "(no clear associated subthemes)"
-
-    sent_counts = stats["sentiment_counts"]
-    sent_block = (
-        f"- positive: {sent_counts.get('positive', 0)}\n"
-        f"- negative: {sent_counts.get('negative', 0)}\n"
-    )
-
-    ex_lines = []
-    for i, ex in enumerate(examples, start=1):
-        conf_str = "n/a" if ex["confidence"] is None else f"{ex['confidence']:.2f}"
-        ex_lines.append(
-            f"{i}. [subtheme={ex.get('subtheme','')}, sentiment={ex['sentiment']}, conf={conf_str}] "
-            f"source={ex['source']}, time={ex['created_time']}\n"
-            f"   evidence: {ex['evidence']}\n"
-            f"   content: {ex['content']}"
-        )
-    examples_block = "\n".join(ex_lines) if ex_lines else "(no examples available)"
+        """.strip()
 
-    prompt = f"""
+_DIM_PROMPT_TEMPLATE = """
         You are a corporate culture analyst. Summarise the following *culture dimension* based on aggregated statistics and representative examples.
 
         Dimension name:
-        - {dimension_name}
+        - {name}
 
         Aggregated statistics:
-        - Total mentions: {stats["total_mentions"]}
+        - Total mentions: {total_mentions}
         - Sentiment counts:
-        {sent_block.strip()}
-        - Average confidence (overall): {stats["avg_confidence"]:.3f}
+        {sent_block}
+        - Average confidence (overall): {avg_confidence:.3f}
         - Key associated subthemes (with frequency):
-        {sub_block if sub_block else "(none)"}
+        {sub_block}
 
         Representative examples (each bullet is one real-world comment snippet):
-        {examples_block if examples_block else "(none)"}
+        {examples_block}
 
         TASK:
         1. Read the data carefully and write a concise, insightful summary of this **dimension** in the corporate culture context.
@@ -273,9 +505,9 @@ def build_prompt_for_dimension(dimension_name: str, stats: Dict[str, Any], examp
             "<pattern 5>"
         ],
         "sentiment_snapshot": {{
-            "positive": {sent_counts.get('positive', 0)},
-            "negative": {sent_counts.get('negative', 0)},
-            "average_confidence": {stats["avg_confidence"]:.3f}
+            "positive": {positive},
+            "negative": {negative},
+            "average_confidence": {avg_confidence:.3f}
         }},
         "top_subthemes": [
             {{"subtheme": "<subtheme_name_1>", "count": <int_count_1>}},
@@ -305,5 +537,74 @@ def build_prompt_for_dimension(dimension_name: str, stats: Dict[str, Any], examp
         - For "top_subthemes", use the subtheme names and counts from the frequency list above.
         - Speak as a human consultant, not an AI model.
         - Output must be valid JSON and parseable.
-        """
-    return prompt.strip()
+        """.strip()
+
+
+def _conf_str(ex: Dict[str, Any]) -> str:
+    return "n/a" if ex["confidence"] is None else f"{ex['confidence']:.2f}"
+
+
+def build_prompt_for_subtheme(subtheme_name: str, stats: Dict[str, Any], examples: List[Dict[str, Any]]) -> str:
+    # Prompt for one subtheme summary.
+    dim_block = "\n".join(
+        f"- {dim}: {c}" for dim, c in stats["dimensions_counter"].items()
+    ) or "(no clear parent dimension)"
+
+    sent_counts = stats["sentiment_counts"]
+    positive = sent_counts.get("positive", 0)
+    negative = sent_counts.get("negative", 0)
+    sent_block = f"- positive: {positive}\n- negative: {negative}"
+
+    examples_block = "\n".join(
+        f"{i}. [sentiment={ex['sentiment']}, dim={ex['dimension']}, conf={_conf_str(ex)}] "
+        f"source={ex['source']}, time={ex['created_time']}\n"
+        f"   evidence: {ex['evidence']}\n"
+        f"   content: {ex['content']}"
+        for i, ex in enumerate(examples, start=1)
+    ) or "(no examples available)"
+
+    return _SUB_PROMPT_TEMPLATE.format_map(
+        {
+            "name": subtheme_name,
+            "total_mentions": stats["total_mentions"],
+            "sent_block": sent_block,
+            "avg_confidence": stats["avg_confidence"],
+            "dim_block": dim_block,
+            "examples_block": examples_block,
+            "positive": positive,
+            "negative": negative,
+        }
+    )
+
+
+def build_prompt_for_dimension(dimension_name: str, stats: Dict[str, Any], examples: List[Dict[str, Any]]) -> str:
+    # Prompt for one culture dimension summary.
+    sub_block = "\n".join(
+        f"- {sub}: {c}" for sub, c in stats["subthemes_counter"].items()
+    ) or "(no clear associated subthemes)"
+
+    sent_counts = stats["sentiment_counts"]
+    positive = sent_counts.get("positive", 0)
+    negative = sent_counts.get("negative", 0)
+    sent_block = f"- positive: {positive}\n- negative: {negative}"
+
+    examples_block = "\n".join(
+        f"{i}. [subtheme={ex.get('subtheme','')}, sentiment={ex['sentiment']}, conf={_conf_str(ex)}] "
+        f"source={ex['source']}, time={ex['created_time']}\n"
+        f"   evidence: {ex['evidence']}\n"
+        f"   content: {ex['content']}"
+        for i, ex in enumerate(examples, start=1)
+    ) or "(no examples available)"
+
+    return _DIM_PROMPT_TEMPLATE.format_map(
+        {
+            "name": dimension_name,
+            "total_mentions": stats["total_mentions"],
+            "sent_block": sent_block,
+            "avg_confidence": stats["avg_confidence"],
+            "sub_block": sub_block,
+            "examples_block": examples_block,
+            "positive": positive,
+            "negative": negative,
+        }
+    )
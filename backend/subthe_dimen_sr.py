@@ -20,13 +20,16 @@
 #   python subthe_dimen_sr.py --csv comments.csv --outdir subthemes_sr --dim-outdir dimensions_sr --overwrite
 #   python subthe_dimen_sr.py --csv comments.csv --outdir subthemes_sr --dim-outdir dimensions_sr --overwrite all
 #   python subthe_dimen_sr.py --csv comments.csv --outdir subthemes_sr --dim-outdir dimensions_sr \
-#       --overwrite "Accountability,Digital"
+#       --overwrite "Accountability,digital_transformation"
+#   python subthe_dimen_sr.py --csv comments.csv --outdir subthemes_sr --dim-outdir dimensions_sr \
+#       --overwrite "*digital*"
 
 from __future__ import annotations
 
 import argparse
 from typing import List
 
+import subthe_dimen_llm
 from subthe_dimen_llm import (
     DEFAULT_MODEL,
     build_client as _build_client_impl,
@@ -46,9 +49,9 @@ def build_client():
     return _build_client_impl()
 
 
-def call_deepseek_json(client, model: str, prompt: str):
+def call_deepseek_json(client, model: str, prompt, **kwargs):
     # Thin wrapper so tests can monkeypatch this name.
-    return _call_deepseek_impl(client, model, prompt)
+    return _call_deepseek_impl(client, model, prompt, **kwargs)
 
 
 def is_quota_or_ratelimit_error(err: Exception) -> bool:
@@ -91,6 +94,20 @@ def main(argv: List[str] | None = None) -> None:
         default=0,
         help="Limit N subthemes for debug (0 = all)",
     )
+    parser.add_argument(
+        "--workers",
+        "--concurrency",
+        dest="workers",
+        type=int,
+        default=4,
+        help="Concurrent LLM requests in flight (1 = sequential); size to the provider's rate limit",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=None,
+        help="Max LLM requests started per minute across workers (default: $LLM_RPM, 0 = unlimited)",
+    )
     parser.add_argument(
         "--overwrite",
         nargs="?",
@@ -100,12 +117,16 @@ def main(argv: List[str] | None = None) -> None:
             "Overwrite behaviour for subthemes and dimensions:\n"
             "  --overwrite           → overwrite all existing files\n"
             "  --overwrite all       → overwrite all existing files\n"
-            "  --overwrite 'A,B,C'   → only overwrite labels whose names contain A or B or C\n"
+            "  --overwrite 'A,B,C'   → only overwrite the labels A, B and C\n"
+            "                          (exact label or file slug, e.g. digital_transformation)\n"
+            "  --overwrite '*digi*'  → overwrite labels matching the wildcard pattern\n"
             "  (default: 'none' → existing files are skipped)"
         ),
     )
 
     args = parser.parse_args(argv)
+    if args.rpm is not None:
+        subthe_dimen_llm.LLM_RPM = args.rpm
 
     run_pipeline(
         args,
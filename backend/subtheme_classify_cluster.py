@@ -1,7 +1,7 @@
 # 2_subtheme_classify_cluster.py
 # 1.Map subthemes (from subthemes.csv) → Dimensions (BGE+SimCSE retrieval + CE rerank)
 # 2.Cluster per dimension to ≤10 reps
-# Usage: python subtheme_classify_cluster.py subthemes.csv [out_json]
+# Usage: python subtheme_classify_cluster.py subthemes.csv [out_json] [--backend torch|onnx]
 # Input: subthemes.csv [sub_theme,count,attitudes_raw,att_pos,att_neg,att_neu,avg_conf,example,ids]
 # Output default: dimension_clusters.json { "Dimension": [ {"representative": "...", "members": ["..."] }, ... ], ... }
 
@@ -10,11 +10,23 @@ import os, re, json, difflib, random, sys
 import numpy as np
 import pandas as pd
 import torch
-from sentence_transformers import SentenceTransformer, util as st_util, CrossEncoder
+from sentence_transformers import SentenceTransformer, CrossEncoder
 from sklearn.cluster import KMeans
 
 # ========== Device & Seed ==========
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+def _detect_device() -> str:
+    # SUBTHEME_DEVICE overrides; else CUDA, then Apple-silicon MPS, then CPU.
+    forced = os.getenv("SUBTHEME_DEVICE", "").strip()
+    if forced:
+        return forced
+    if torch.cuda.is_available():
+        return "cuda"
+    mps = getattr(torch.backends, "mps", None)
+    if mps is not None and mps.is_available():
+        return "mps"
+    return "cpu"
+
+DEVICE = _detect_device()
 SEED = 42
 random.seed(SEED); np.random.seed(SEED); torch.manual_seed(SEED)
 
@@ -44,6 +56,11 @@ DIM_DESC = {
 DIM_KEYS  = list(DIM_DESC.keys())
 DESC_LIST = [f"{k}. {DIM_DESC[k]}" for k in DIM_KEYS]
 
+# ========== Cross-encoder base ==========
+# Small MiniLM reranker (22M params). Override with CE_BASE_MODEL to try another
+# compact cross-encoder; retune CR_ENT_TH_BASE against the gold set if you do.
+CE_BASE = os.getenv("CE_BASE_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
 # ========== CE Templates ==========
 CE_TEMPLATES = [
     "This text is about {}. Definition: {}",
@@ -62,10 +79,11 @@ MARGIN         = 0.20
 PER_LABEL_DELTA = {}  # add per-dimension tweaks here if needed
 
 # ========== Small helpers ==========
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
 def _norm(s: str) -> str:
-    s = (s or "").lower()
-    s = re.sub(r"[^a-z0-9]+", " ", s)
-    return re.sub(r"\s+", " ", s).strip()
+    # non-alphanumerics -> single spaces (the sub already collapses runs)
+    return _NON_ALNUM_RE.sub(" ", (s or "").lower()).strip()
 
 CANON_NORM = {_norm(k): k for k in DIM_KEYS}
 
@@ -101,12 +119,20 @@ ALIAS = {
 }
 _ALIAS_NORM = {k: list({_norm(x) for x in v}) for k, v in ALIAS.items()}
 
+def _match_terms(name: str) -> tuple:
+    # normalized aliases + dimension name variants (non-empty)
+    terms = set(_ALIAS_NORM.get(name, [])) | {_norm(name), _norm(name.replace("-", " "))}
+    return tuple(t for t in terms if t)
+
+_MATCH_TERMS = {name: _match_terms(name) for name in DIM_KEYS}
+
 def force_candidates(text_raw: str, cand_idx: set, dim_keys: list) -> set:
     txt = _norm(text_raw)
     for i, name in enumerate(dim_keys):
-        name_norms = {_norm(name), _norm(name.replace("-", " "))}
-        alias_norms = set(_ALIAS_NORM.get(name, [])) | name_norms
-        if any(a and a in txt for a in alias_norms):
+        terms = _MATCH_TERMS.get(name)
+        if terms is None:
+            terms = _match_terms(name)
+        if any(a in txt for a in terms):
             cand_idx.add(i)
     return cand_idx
 
@@ -115,63 +141,154 @@ def dynamic_threshold(sims_row: np.ndarray) -> float:
     return CR_ENT_TH_BASE - (ADAPT_DELTA if mean_sim < 0.45 else 0.0)
 
 # ========== Models ==========
-def load_models():
+# fp16 weights for both bi-encoders and the CE on CUDA (SUBTHEME_FP16=0 keeps fp32).
+# Similarities are upcast to fp32 in bi_sims before thresholding.
+USE_FP16 = DEVICE.startswith("cuda") and os.getenv("SUBTHEME_FP16", "1") == "1"
+
+# "torch" (default) or "onnx": ONNX Runtime via sentence-transformers' backend=
+# (needs optimum + onnxruntime); meant for CPU-only runs. Also --backend on the CLI.
+BACKENDS = ("torch", "onnx")
+BACKEND = os.getenv("SUBTHEME_BACKEND", "torch")
+ONNX_DIR = MODELS_DIR / "onnx"
+
+def _load_onnx(cls, name: str):
+    # Export hub models once into ONNX_DIR and reuse the exported copy on later runs.
+    # Local dirs (the fine-tuned CE) are re-exported each time so retraining is never shadowed.
+    if os.path.isdir(name):
+        return cls(name, device=DEVICE, backend="onnx")
+    local = ONNX_DIR / name.replace("/", "__")
+    if local.is_dir() and any(local.iterdir()):
+        return cls(str(local), device=DEVICE, backend="onnx")
+    model = cls(name, device=DEVICE, backend="onnx")
+    try:
+        model.save_pretrained(str(local))
+    except Exception as e:
+        print("[ONNX] could not cache export for", name, "-", e)
+    return model
+
+def _load(cls, name: str, backend: str):
+    if backend == "onnx":
+        try:
+            return _load_onnx(cls, name), True
+        except Exception as e:
+            print("[ONNX] backend unavailable for", name, "- using torch:", e)
+    return cls(name, device=DEVICE), False
+
+def load_models(backend: str = BACKEND):
     # Bi-encoders
-    bi1 = SentenceTransformer("BAAI/bge-base-en-v1.5", device=DEVICE)
-    bi2 = SentenceTransformer("princeton-nlp/sup-simcse-roberta-base", device=DEVICE)
+    bi1, onnx1 = _load(SentenceTransformer, "BAAI/bge-base-en-v1.5", backend)
+    bi2, onnx2 = _load(SentenceTransformer, "princeton-nlp/sup-simcse-roberta-base", backend)
+    if USE_FP16 and not (onnx1 or onnx2):
+        bi1, bi2 = bi1.half(), bi2.half()
     def encode1(txts): return bi1.encode(txts, convert_to_tensor=True, normalize_embeddings=True, batch_size=64)
     def encode2(txts): return bi2.encode(txts, convert_to_tensor=True, normalize_embeddings=True, batch_size=64)
     with torch.no_grad():
         dim_emb1 = encode1(DESC_LIST).to(DEVICE)
         dim_emb2 = encode2(DESC_LIST).to(DEVICE)
+    if USE_FP16:
+        # fp16 dimension embeddings -> tensor-core similarity matmul
+        dim_emb1, dim_emb2 = dim_emb1.half(), dim_emb2.half()
     # Cross-encoder (load FT if present)
-    CE_BASE = "cross-encoder/ms-marco-MiniLM-L-6-v2"
     ft_dir = str(OUT_DIR / "cross_encoder_ft")
     if os.path.isdir(ft_dir) and len(os.listdir(ft_dir)) > 0:
         print("[CE] Loading fine-tuned CE:", ft_dir)
-        cr = CrossEncoder(ft_dir, device=DEVICE)
+        cr, cr_onnx = _load(CrossEncoder, ft_dir, backend)
     else:
         print("[CE] Using base CE:", CE_BASE)
-        cr = CrossEncoder(CE_BASE, device=DEVICE)
+        cr, cr_onnx = _load(CrossEncoder, CE_BASE, backend)
+    if cr_onnx:
+        pass  # ORT graph: torch int8/fp16 casts don't apply
+    elif DEVICE == "cpu" and os.getenv("CE_INT8", "1") == "1":
+        cr = quantize_ce(cr)
+    elif USE_FP16:
+        (cr if isinstance(cr, torch.nn.Module) else cr.model).half()
+        print("[CE] fp16 weights enabled")
     return encode1, encode2, dim_emb1, dim_emb2, cr
 
+def quantize_ce(cr: CrossEncoder) -> CrossEncoder:
+    # Dynamic int8 quantization of the CE's Linear layers (CPU only; set CE_INT8=0 to disable).
+    try:
+        from torch.ao.quantization import quantize_dynamic
+        target = cr if isinstance(cr, torch.nn.Module) else cr.model
+        quantize_dynamic(target, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        print("[CE] int8 dynamic quantization enabled")
+    except Exception as e:
+        print("[CE] int8 quantization skipped:", e)
+    return cr
+
+CE_BATCH = 128
+
 def cr_pos_prob(cr: CrossEncoder, pairs):
-    out = cr.predict(pairs, apply_softmax=True)
+    # Longest pairs first so each batch pads to similar lengths (SentenceTransformer.encode
+    # already sorts internally; older CrossEncoder.predict does not). Scores come back in input order.
+    if not pairs:
+        return np.zeros(0, dtype=np.float32)
+    order = np.argsort([-(len(a) + len(b)) for a, b in pairs], kind="stable")
+    out = cr.predict([pairs[i] for i in order], apply_softmax=True, batch_size=CE_BATCH)
     if isinstance(out, torch.Tensor):
         out = out.detach().cpu().numpy()
-    return out[:, 1] if out.ndim == 2 and out.shape[1] == 2 else out.squeeze()
+    out = np.asarray(out)
+    out = out[:, 1] if out.ndim == 2 and out.shape[1] == 2 else out.reshape(len(pairs), -1).squeeze(-1)
+    probs = np.empty_like(out)
+    probs[order] = out
+    return probs
 
 # ========== Mapping (keep your precision-first flow) ==========
-def map_one(text: str, encode1, encode2, dim_emb1, dim_emb2, cr: CrossEncoder):
-    with torch.no_grad():
-        x1 = encode1([text]).to(DEVICE)
-        x2 = encode2([text]).to(DEVICE)
-        s1 = st_util.cos_sim(x1, dim_emb1).squeeze(0).cpu().numpy()
-        s2 = st_util.cos_sim(x2, dim_emb2).squeeze(0).cpu().numpy()
-    s1 = (s1 + 1.0) / 2.0
-    s2 = (s2 + 1.0) / 2.0
-    sims = (s1 + s2) / 2.0
-
-    over  = np.where(sims >= BI_SIM_TH)[0].tolist()
-    topm  = np.argsort(-sims)[:BI_TOP_M].tolist()
-    cand_idx = set(over + topm)
-    cand_idx = force_candidates(text, cand_idx, DIM_KEYS)
-    if not cand_idx:
-        cand_idx = set(topm)
-
+# Per-text similarity rows, reused between mapping and clustering.
+# Reset whenever a different pair of encoders is passed in.
+_SIM_CACHE = {"encoders": None, "rows": {}}
+
+def bi_sims(texts: list[str], encode1, encode2, dim_emb1, dim_emb2) -> np.ndarray:
+    # Averaged BGE/SimCSE similarity of each text to each dimension, in [0,1]. Shape [N, D].
+    # Only texts not seen before (with these encoders) are encoded, each once.
+    if _SIM_CACHE["encoders"] != (encode1, encode2):
+        _SIM_CACHE["encoders"] = (encode1, encode2)
+        _SIM_CACHE["rows"] = {}
+    rows = _SIM_CACHE["rows"]
+
+    todo = uniq_keep([t for t in texts if t not in rows])
+    if todo:
+        # Embeddings are unit-norm (normalize_embeddings=True), so cosine == dot product.
+        with torch.no_grad():
+            x1 = encode1(todo).to(DEVICE, dtype=dim_emb1.dtype)
+            x2 = encode2(todo).to(DEVICE, dtype=dim_emb2.dtype)
+            # mean of the two [0,1]-rescaled cosines, fused on device: one host transfer
+            sims = ((x1 @ dim_emb1.T).float() + (x2 @ dim_emb2.T).float() + 2.0) / 4.0
+            sims = sims.cpu().numpy()
+        for t, row in zip(todo, sims):
+            rows[t] = row
+    return np.stack([rows[t] for t in texts]) if texts else np.zeros((0, len(DIM_KEYS)), dtype=np.float32)
+
+def retrieval_mask(sims_all: np.ndarray) -> np.ndarray:
+    # [N, D] bool: dims over BI_SIM_TH or in each row's top BI_TOP_M (argpartition, no full sort)
+    mask = sims_all >= BI_SIM_TH
+    m = min(BI_TOP_M, sims_all.shape[1])
+    if m >= sims_all.shape[1]:
+        mask[:] = True
+    elif m > 0:
+        topm = np.argpartition(-sims_all, m - 1, axis=1)[:, :m]
+        np.put_along_axis(mask, topm, True, axis=1)
+    return mask
+
+def _candidates(text: str, sims: np.ndarray, base_mask: np.ndarray):
+    over_set = set(np.flatnonzero(base_mask).tolist())
+    cand_idx = force_candidates(text, set(over_set), DIM_KEYS)
     cand_idx = sorted(cand_idx, key=lambda k: -sims[k])
-    cand = [DIM_KEYS[i] for i in cand_idx]
+    return cand_idx, over_set
 
+def _ce_pairs(text: str, cand: list[str]):
     pairs = []
     for d in cand:
         desc = DIM_DESC[d]
         for t in CE_TEMPLATES:
             pairs.append((text, t.format(d, desc)))
-    probs_all = cr_pos_prob(cr, pairs)
+    return pairs
+
+def _decide(sims: np.ndarray, cand_idx: list[int], over_set: set, probs_all: np.ndarray) -> list[str]:
+    cand = [DIM_KEYS[i] for i in cand_idx]
     probs = np.max(probs_all.reshape(len(cand), -1), axis=1)
 
     base_cr = dynamic_threshold(sims[cand_idx])
-    over_set = set(over + topm)
     alias_only = set(cand_idx) - over_set
 
     keep = []
@@ -196,16 +313,39 @@ def map_one(text: str, encode1, encode2, dim_emb1, dim_emb2, cr: CrossEncoder):
     keep_dims = [canonize_dim(d) or d for d in keep_dims]
     return keep_dims
 
+def map_many(texts: list[str], encode1, encode2, dim_emb1, dim_emb2, cr: CrossEncoder) -> list[list[str]]:
+    # Bi-encoder retrieval and CE rerank for all texts, each in one batched call.
+    if not texts:
+        return []
+    uniq = uniq_keep(texts)
+    if len(uniq) < len(texts):
+        # map each distinct text once, then broadcast back
+        by_text = dict(zip(uniq, map_many(uniq, encode1, encode2, dim_emb1, dim_emb2, cr)))
+        return [list(by_text[t]) for t in texts]
+    sims_all = bi_sims(texts, encode1, encode2, dim_emb1, dim_emb2)
+
+    # Collect CE pairs for every text, score them in one predict call, then split back.
+    base_masks = retrieval_mask(sims_all)
+    plans, all_pairs, offsets = [], [], [0]
+    for text, sims, base_mask in zip(texts, sims_all, base_masks):
+        cand_idx, over_set = _candidates(text, sims, base_mask)
+        plans.append((cand_idx, over_set))
+        all_pairs.extend(_ce_pairs(text, [DIM_KEYS[i] for i in cand_idx]))
+        offsets.append(len(all_pairs))
+    probs_flat = np.asarray(cr_pos_prob(cr, all_pairs)).reshape(-1)
+
+    out = []
+    for n, (sims, (cand_idx, over_set)) in enumerate(zip(sims_all, plans)):
+        probs_all = probs_flat[offsets[n]:offsets[n + 1]]
+        out.append(_decide(sims, cand_idx, over_set, probs_all))
+    return out
+
+def map_one(text: str, encode1, encode2, dim_emb1, dim_emb2, cr: CrossEncoder):
+    return map_many([text], encode1, encode2, dim_emb1, dim_emb2, cr)[0]
+
 # ========== Clustering (≤10 reps per dimension) ==========
 def embed_texts_for_cluster(texts: list[str], dim_name: str, encode1, encode2, dim_emb1, dim_emb2) -> np.ndarray:
-    with torch.no_grad():
-        x1 = encode1(texts).to(DEVICE)
-        x2 = encode2(texts).to(DEVICE)
-        s1 = st_util.cos_sim(x1, dim_emb1).cpu().numpy()
-        s2 = st_util.cos_sim(x2, dim_emb2).cpu().numpy()
-    s1 = (s1 + 1.0) / 2.0
-    s2 = (s2 + 1.0) / 2.0
-    sims = (s1 + s2) / 2.0  # [N, 14]
+    sims = bi_sims(texts, encode1, encode2, dim_emb1, dim_emb2)  # [N, 14]
     idx = DIM_KEYS.index(dim_name)
     w = np.full_like(sims, 0.6, dtype=np.float32)
     w[:, idx] = 2.0
@@ -262,16 +402,32 @@ def cluster_within_dimensions(mapped_rows, encode1, encode2, dim_emb1, dim_emb2,
     return dim_to_clusters
 
 # ========== Main ==========
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python map_subthemes_to_clusters.py subthemes.csv [out_json]")
+def read_subthemes(csv_in: Path) -> pd.DataFrame:
+    # Prefer the Parquet sidecar written by data_process.py when it is at least as new as the CSV.
+    parq = csv_in.with_suffix(".parquet")
+    if parq.exists() and parq.stat().st_mtime >= csv_in.stat().st_mtime:
+        try:
+            return pd.read_parquet(parq)
+        except Exception as e:
+            print("[warn] cannot read", parq, "- falling back to CSV:", e)
+    df = pd.read_csv(csv_in, encoding="utf-8-sig")
+    return df.rename(columns={c: c.lstrip("\ufeff") for c in df.columns})
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    backend = BACKEND
+    if "--backend" in argv:
+        i = argv.index("--backend")
+        backend = argv[i + 1] if i + 1 < len(argv) else ""
+        del argv[i:i + 2]
+    if len(argv) < 1 or backend not in BACKENDS:
+        print("Usage: python map_subthemes_to_clusters.py subthemes.csv [out_json] [--backend torch|onnx]")
         sys.exit(1)
 
-    csv_in = Path(sys.argv[1]).resolve()
-    out_json = Path(sys.argv[2]).resolve() if len(sys.argv) >= 3 else (csv_in.parent / "dimension_clusters.json")
+    csv_in = Path(argv[0]).resolve()
+    out_json = Path(argv[1]).resolve() if len(argv) >= 2 else (csv_in.parent / "dimension_clusters.json")
 
-    df = pd.read_csv(csv_in, encoding="utf-8-sig")
-    df = df.rename(columns={c: c.lstrip("\ufeff") for c in df.columns})
+    df = read_subthemes(csv_in)
     if "sub_theme" not in df.columns:
         raise RuntimeError("CSV must contain column: sub_theme")
 
@@ -279,13 +435,11 @@ def main():
     subthemes = uniq_keep([str(s).strip() for s in df["sub_theme"].tolist() if str(s).strip()])
 
     # 2) load models/embeddings
-    encode1, encode2, dim_emb1, dim_emb2, cr = load_models()
+    encode1, encode2, dim_emb1, dim_emb2, cr = load_models(backend=backend)
 
-    # 3) map each subtheme to dims (precision-first)
-    rows = []
-    for st in subthemes:
-        dims = map_one(st, encode1, encode2, dim_emb1, dim_emb2, cr)
-        rows.append({"subtheme": st, "mapped_dimensions": "|".join(dims)})
+    # 3) map all subthemes to dims (precision-first, batched bi-encoder)
+    mapped = map_many(subthemes, encode1, encode2, dim_emb1, dim_emb2, cr)
+    rows = [{"subtheme": st, "mapped_dimensions": "|".join(dims)} for st, dims in zip(subthemes, mapped)]
 
     # 4) cluster within each dimension to ≤10 reps
     clusters = cluster_within_dimensions(rows, encode1, encode2, dim_emb1, dim_emb2, max_k=10)
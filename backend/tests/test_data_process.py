@@ -4,6 +4,7 @@
 # - Patch paths to a temporary folder (no real project files are touched)
 # - Mock call_llm so no real LLM / API is called
 # - Check that comments.csv and subthemes.csv are generated correctly
+# - Check the subthemes.parquet sidecar (only when pyarrow is installed)
 #
 # Usage:
 #   pytest tests/test_data_process.py -q
@@ -11,6 +12,7 @@
 import json
 from pathlib import Path
 import pandas as pd
+import pytest
 import data_process
 
 def test_data_process_generates_comments_and_subthemes(tmp_path, monkeypatch):
@@ -133,3 +135,33 @@ def test_data_process_generates_comments_and_subthemes(tmp_path, monkeypatch):
     counts = dict(zip(df_sum["sub_theme"], df_sum["count"]))
     assert counts["Safety"] == 1
     assert counts["Innovation"] == 1
+
+
+def test_subtheme_summary_writes_parquet_sidecar(tmp_path, monkeypatch):
+    # Sidecar is optional: without pyarrow only subthemes.csv is written
+    pytest.importorskip("pyarrow")
+
+    csv_out = tmp_path / "comments.csv"
+    subs_csv = tmp_path / "subthemes.csv"
+    pd.DataFrame(
+        {
+            "ID": [1, 2],
+            "text": ["safety first", "new ideas"],
+            "subthemes": ["Safety", "Innovation|Safety"],
+            "subs_sentiment": [
+                json.dumps({"Safety": "positive"}),
+                json.dumps({"Innovation": "positive", "Safety": "negative"}),
+            ],
+            "confidence": [0.9, 0.8],
+            "subs_evidences": [json.dumps({}), json.dumps({})],
+        }
+    ).to_csv(csv_out, index=False, encoding="utf-8-sig")
+    monkeypatch.setattr(data_process, "CSV_OUT", csv_out)
+    monkeypatch.setattr(data_process, "SUBS_CSV", subs_csv)
+
+    data_process.rebuild_subtheme_summary()
+
+    df_csv = pd.read_csv(subs_csv, encoding="utf-8")
+    df_parq = pd.read_parquet(subs_csv.with_suffix(".parquet"))
+    assert list(df_parq.columns) == list(df_csv.columns)
+    assert set(df_parq["sub_theme"]) == {"Safety", "Innovation"}
@@ -130,8 +130,11 @@ def test_overall_sr_main_creates_json(tmp_path, monkeypatch):
         # Client is not used by fake_call_deepseek_json
         return None
 
-    def fake_call_deepseek_json(client, model, prompt):
+    llm_kwargs = []
+
+    def fake_call_deepseek_json(client, model, prompt, **kwargs):
         # Return a minimal valid structure that matches the expected schema
+        llm_kwargs.append(kwargs)
         return {
             "report_title": "Test Report",
             "section": {
@@ -184,3 +187,61 @@ def test_overall_sr_main_creates_json(tmp_path, monkeypatch):
     assert "dataset_metadata" in data
     assert "time_coverage" in data["dataset_metadata"]
     assert "volume" in data["dataset_metadata"]
+
+    # one LLM call, without the inner retry loop (call_llm_with_backoff retries)
+    assert llm_kwargs == [{"retry": False, "max_tokens": 1200}]
+
+
+# Short output keys from the LLM are expanded back to the documented schema
+def test_expand_keys_restores_full_names():
+    compact = {
+        "s": {
+            "eb": {
+                "t": "Title",
+                "ki": ["a"],
+                "ro": {"r": [{"nm": "Risk", "d": "desc"}], "o": []},
+                "ar": [{"rec": "Do it", "ow": "HR", "im": "High"}],
+                "nt": "note",
+            }
+        }
+    }
+
+    full = overall_sr.expand_keys(compact)
+    briefing = full["section"]["executive_briefing"]
+    assert briefing["title"] == "Title"
+    assert briefing["key_insights"] == ["a"]
+    assert briefing["risks_and_opportunities"]["risks"][0] == {"name": "Risk", "description": "desc"}
+    assert briefing["actionable_recommendations"][0]["ownership"] == "HR"
+    assert briefing["note"] == "note"
+
+    # Already-expanded output is left unchanged
+    assert overall_sr.expand_keys(full) == full
+
+
+# Transient errors are retried; quota errors open the breaker and fail fast
+def test_call_llm_with_backoff_retries_and_breaks(monkeypatch):
+    monkeypatch.setattr(overall_sr, "_breaker", {"open_until": 0.0})
+    calls = []
+
+    def flaky(client, model, prompt):
+        calls.append(1)
+        if len(calls) < 3:
+            raise RuntimeError("502 bad gateway")
+        return {"ok": True}
+
+    out = overall_sr.call_llm_with_backoff(None, "m", "p", call_fn=flaky, sleep_fn=lambda s: None)
+    assert out == {"ok": True}
+    assert len(calls) == 3
+
+    def quota(client, model, prompt):
+        calls.append(1)
+        raise RuntimeError("429 too many requests")
+
+    calls.clear()
+    for _ in range(2):
+        try:
+            overall_sr.call_llm_with_backoff(None, "m", "p", call_fn=quota, sleep_fn=lambda s: None)
+        except RuntimeError:
+            pass
+    # second call is short-circuited by the open breaker
+    assert len(calls) == 1
@@ -2,6 +2,7 @@
 # Features:
 # - Verify key backend scripts exist under backend/
 # - Check expected data/ directory structure is present
+# - Check in-process steps are released afterwards and keep tracebacks on failure
 #
 # Usage:
 #   pytest tests/test_pipeline_structure.py -q
@@ -45,3 +46,63 @@ def test_data_directories_exist_or_can_be_created():
     for d in (processed_dir, raw_dir, gold_dir):
         if d.exists():
             assert d.is_dir(), f"{d} exists but is not a directory"
+
+
+def test_run_step_calls_module_main_in_process(tmp_path):
+    # run_step should import the script and pass argv to its main()
+    import pipeline
+
+    script = tmp_path / "fake_step_mod.py"
+    script.write_text(
+        "from pathlib import Path\n"
+        "def main(argv=None):\n"
+        "    Path(argv[0]).write_text('ran')\n",
+        encoding="utf-8",
+    )
+    marker = tmp_path / "marker.txt"
+    pipeline.run_step("fake_step_mod.py", [marker], cwd=tmp_path)
+    assert marker.read_text() == "ran"
+
+
+def test_release_step_clears_step_caches(tmp_path):
+    # A finished in-process step must not keep its cached models alive
+    import sys
+    import pipeline
+
+    script = tmp_path / "fake_cached_step.py"
+    script.write_text(
+        "from functools import lru_cache\n"
+        "@lru_cache(maxsize=None)\n"
+        "def get_model():\n"
+        "    return object()\n"
+        "def main(argv=None):\n"
+        "    get_model()\n",
+        encoding="utf-8",
+    )
+    sys.path.insert(0, str(tmp_path))
+    try:
+        import fake_cached_step
+        get_model = fake_cached_step.get_model
+        get_model()
+        pipeline.release_step("fake_cached_step")
+    finally:
+        sys.path.remove(str(tmp_path))
+    assert get_model.cache_info().currsize == 0
+    assert "fake_cached_step" not in sys.modules
+
+
+def test_run_step_prints_traceback_on_failure(tmp_path, capsys):
+    # An in-process step error keeps its stack trace in the output
+    import pytest
+    import pipeline
+
+    script = tmp_path / "fake_failing_step.py"
+    script.write_text(
+        "def main(argv=None):\n"
+        "    raise ValueError('boom')\n",
+        encoding="utf-8",
+    )
+    with pytest.raises(SystemExit):
+        pipeline.run_step("fake_failing_step.py", [], cwd=tmp_path)
+    err = capsys.readouterr().err
+    assert "Traceback" in err and "ValueError: boom" in err
@@ -4,6 +4,8 @@
 # - Patch CSV_IN and patch infer_binary_sentiment
 # - Run sentiment_dbcheck.main()
 # - Check updated subsentiment, confidence, and evidences remain unchanged
+# - VADER chunks reuse the shared pool from main() (thread path without one)
+# - Tokenize-ahead batches match the inline batches, in order
 #
 # Usage:
 #   pytest tests/test_sentiment_dbcheck.py -q
@@ -81,3 +83,130 @@ def test_sentiment_dbcheck_updates_neutral_and_confidence(tmp_path, monkeypatch)
     evid_map = json.loads(out_row["subs_evidences"])
     assert evid_map["Safety"] == "improved safety culture"
     assert evid_map["Innovation"] == "some innovative projects"
+
+
+def test_infer_binary_sentiment_keeps_input_order(monkeypatch):
+    # Transformers see length-sorted texts; results must come back in input order
+    seen = []
+
+    def fake_model(texts):
+        seen.append(list(texts))
+        labels = ["positive" if t.startswith("good") else "negative" for t in texts]
+        return labels, [0.9 if l == "positive" else 0.1 for l in labels]
+
+    def fake_vader_async(texts):
+        result = fake_model(texts)
+        return lambda: result
+
+    monkeypatch.setattr(sentiment_dbcheck, "pred_roberta", fake_model)
+    monkeypatch.setattr(sentiment_dbcheck, "pred_sst2", fake_model)
+    monkeypatch.setattr(sentiment_dbcheck, "pred_vader_async", fake_vader_async)
+
+    texts = ["good but a very long comment", "bad", "good one"]
+    labels, confs = sentiment_dbcheck.infer_binary_sentiment(texts)
+
+    # VADER sees the input order; both transformers see the length-sorted order
+    assert seen[0] == texts
+    assert seen[1] == seen[2] == ["bad", "good one", "good but a very long comment"]
+    assert labels == ["positive", "negative", "positive"]
+    assert len(confs) == 3
+
+
+def test_sentiment_dbcheck_processes_file_in_chunks(tmp_path, monkeypatch):
+    # Several small chunks must produce the same single output file
+    csv_path = tmp_path / "comments.csv"
+    rows = [
+        {
+            "ID": i,
+            "text": f"comment {i}",
+            "subthemes": "Safety",
+            "subs_sentiment": json.dumps({"Safety": "neutral" if i % 2 else "negative"}),
+            "confidence": 0.5,
+            "subs_evidences": json.dumps({"Safety": ""}),
+        }
+        for i in range(1, 6)
+    ]
+    pd.DataFrame(rows).to_csv(csv_path, index=False, encoding="utf-8")
+
+    monkeypatch.setattr(sentiment_dbcheck, "CSV_IN", csv_path)
+    monkeypatch.setattr(sentiment_dbcheck, "CHUNK_ROWS", 2)
+    monkeypatch.setattr(
+        sentiment_dbcheck,
+        "infer_binary_sentiment",
+        lambda texts: (["positive"] * len(texts), [0.8] * len(texts)),
+    )
+
+    sentiment_dbcheck.main()
+
+    df_out = pd.read_csv(csv_path, encoding="utf-8")
+    assert list(df_out.columns) == sentiment_dbcheck.REQUIRED_COLS
+    assert df_out["ID"].tolist() == [1, 2, 3, 4, 5]
+    labels = [json.loads(s)["Safety"] for s in df_out["subs_sentiment"]]
+    assert labels == ["positive", "negative", "positive", "negative", "positive"]
+    assert not (tmp_path / "comments.csv.tmp").exists()
+
+
+def test_process_chunk_scores_duplicate_texts_once(monkeypatch):
+    # The same evidence text across rows/subthemes goes to the models once
+    seen = []
+
+    def fake_infer(texts):
+        seen.append(list(texts))
+        return ["positive" if t == "great" else "negative" for t in texts], [0.7] * len(texts)
+
+    monkeypatch.setattr(sentiment_dbcheck, "infer_binary_sentiment", fake_infer)
+
+    df = pd.DataFrame([
+        {"ID": 1, "text": "t1", "subthemes": "A|B", "confidence": 0.5,
+         "subs_sentiment": json.dumps({"A": "neutral", "B": "neutral"}),
+         "subs_evidences": json.dumps({"A": "great", "B": "awful"})},
+        {"ID": 2, "text": "t2", "subthemes": "A", "confidence": 0.5,
+         "subs_sentiment": json.dumps({"A": "neutral"}),
+         "subs_evidences": json.dumps({"A": "great"})},
+    ])
+
+    assert sentiment_dbcheck.process_chunk(df) == 3
+    assert seen == [["great", "awful"]]
+    assert json.loads(df.at[0, "subs_sentiment"]) == {"A": "positive", "B": "negative"}
+    assert json.loads(df.at[1, "subs_sentiment"]) == {"A": "positive"}
+
+
+def test_pred_vader_async_reuses_shared_pool(monkeypatch):
+    # main() starts one pool; every chunk maps onto it and none closes it
+    from multiprocessing.pool import ThreadPool
+
+    monkeypatch.setattr(sentiment_dbcheck, "_vader_compound", lambda t: 0.5 if t == "good" else -0.5)
+    monkeypatch.setattr(sentiment_dbcheck, "VADER_POOL_MIN", 2)
+    pool = ThreadPool(2)
+    monkeypatch.setattr(sentiment_dbcheck, "_VADER_POOL", pool)
+    try:
+        for _ in range(2):
+            labels, pos_probs = sentiment_dbcheck.pred_vader_async(["good", "bad", "good"])()
+            assert list(labels) == ["positive", "negative", "positive"]
+            assert list(pos_probs) == [0.75, 0.25, 0.75]
+    finally:
+        pool.close()
+        pool.join()
+
+    # no pool (CPU runs, or outside main): background thread path
+    monkeypatch.setattr(sentiment_dbcheck, "_VADER_POOL", None)
+    labels, _ = sentiment_dbcheck.pred_vader_async(["bad"])()
+    assert list(labels) == ["negative"]
+
+
+def test_encoded_batches_tokenize_ahead_matches_inline(monkeypatch):
+    # Prefetching the next batch on a thread must yield the same batches in order.
+    import torch
+
+    def fake_tok(batch, **kwargs):
+        return {"input_ids": torch.tensor([[len(t)] for t in batch])}
+
+    texts = ["a" * i for i in range(1, 12)] + [None]
+    monkeypatch.setattr(sentiment_dbcheck, "DEVICE", torch.device("cpu"))
+    monkeypatch.setattr(sentiment_dbcheck, "TOKENIZE_AHEAD", False)
+    inline = [b["input_ids"].tolist() for b in sentiment_dbcheck._encoded_batches(fake_tok, texts, 8, 5, "cpu")]
+    monkeypatch.setattr(sentiment_dbcheck, "TOKENIZE_AHEAD", True)
+    ahead = [b["input_ids"].tolist() for b in sentiment_dbcheck._encoded_batches(fake_tok, texts, 8, 5, "cpu")]
+
+    assert ahead == inline
+    assert [len(b) for b in ahead] == [5, 5, 2]
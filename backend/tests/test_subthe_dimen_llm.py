@@ -0,0 +1,130 @@
+# Tests for subthe_dimen_llm streaming JSON calls
+# Features:
+# - Test call_deepseek_json on a streamed JSON response
+# - Ensure a non-JSON stream is aborted early and retried with a strict reminder
+# - Reuse a cached response for a repeated (model, prompt) when LLM_CACHE_DIR is set
+# - Retry transient failures with backoff but not exhausted quota
+# - retry=False leaves retrying to the caller (single attempt)
+# - Repair near-JSON locally instead of asking the LLM to fix it
+#
+# Usage:
+#   pytest tests/test_subthe_dimen_llm.py -q
+
+from types import SimpleNamespace
+import subthe_dimen_llm
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeStream:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for p in self.pieces:
+            self.consumed += 1
+            yield _chunk(p)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+        self.streams = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        stream = FakeStream(self.responses.pop(0))
+        self.streams.append(stream)
+        return stream
+
+
+def test_call_deepseek_json_reads_streamed_json():
+    client = FakeClient([["```json\n", '{"a": ', "1}", "\n```"]])
+    out = subthe_dimen_llm.call_deepseek_json(client, "m", "prompt")
+    assert out == {"a": 1}
+    assert client.calls[0]["stream"] is True
+    assert client.calls[0]["response_format"] == {"type": "json_object"}
+    assert client.streams[0].closed
+
+
+def test_call_deepseek_json_aborts_non_json_and_retries():
+    bad = ["Sure", ", here is", " the report", " you asked for"]
+    client = FakeClient([bad, ['{"ok": true}']])
+    out = subthe_dimen_llm.call_deepseek_json(client, "m", "prompt")
+    assert out == {"ok": True}
+    # first stream stopped after the first chunk
+    assert client.streams[0].consumed == 1
+    assert client.calls[1]["messages"][-1]["content"] == subthe_dimen_llm.STRICT_JSON_REMINDER
+
+
+def test_call_deepseek_json_repairs_locally():
+    client = FakeClient([['{"a": [1, 2,], "b": True, "c": "x, }",}']])
+    out = subthe_dimen_llm.call_deepseek_json(client, "m", "prompt")
+    assert out == {"a": [1, 2], "b": True, "c": "x, }"}
+    # no second "fix the JSON" request
+    assert len(client.calls) == 1
+
+
+def test_repair_json_gives_up_on_non_ascii_bare_words():
+    # not repairable locally: returns None (caller falls back to the LLM fix-up)
+    assert subthe_dimen_llm._repair_json('{"a": café}') is None
+    assert subthe_dimen_llm._repair_json('{"a": 1, ñ: 2}') is None
+
+
+def test_call_deepseek_json_uses_disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(subthe_dimen_llm, "LLM_CACHE_DIR", str(tmp_path))
+    client = FakeClient([['{"a": 1}']])
+    assert subthe_dimen_llm.call_deepseek_json(client, "m", "prompt") == {"a": 1}
+    # same model + prompt: served from disk, no second request
+    assert subthe_dimen_llm.call_deepseek_json(client, "m", "prompt") == {"a": 1}
+    assert len(client.calls) == 1
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+
+def test_call_with_backoff_retries_transient_not_quota():
+    calls = []
+
+    def flaky(client, model, prompt):
+        calls.append(prompt)
+        if len(calls) < 2:
+            raise RuntimeError("429 Too Many Requests")
+        return {"ok": True}
+
+    out = subthe_dimen_llm.call_with_backoff(flaky, None, "m", "p", sleep_fn=lambda s: None)
+    assert out == {"ok": True}
+    assert len(calls) == 2
+
+    def broke(client, model, prompt):
+        calls.append(prompt)
+        raise RuntimeError("402 insufficient_quota")
+
+    calls.clear()
+    try:
+        subthe_dimen_llm.call_with_backoff(broke, None, "m", "p", sleep_fn=lambda s: None)
+    except RuntimeError:
+        pass
+    assert len(calls) == 1
+
+
+def test_call_deepseek_json_retry_false_makes_one_attempt(monkeypatch):
+    calls = []
+
+    def flaky(client, model, prompt, max_tokens=None):
+        calls.append(max_tokens)
+        raise RuntimeError("502 bad gateway")
+
+    monkeypatch.setattr(subthe_dimen_llm, "_call_deepseek_json", flaky)
+    try:
+        subthe_dimen_llm.call_deepseek_json(None, "m", "p", retry=False, max_tokens=700)
+    except RuntimeError:
+        pass
+    assert calls == [700]
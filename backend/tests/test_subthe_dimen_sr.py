@@ -2,6 +2,11 @@
 # Features:
 # - Test aggregate_by_subtheme with a minimal single-row DataFrame
 # - Test aggregate_dimensions_from_sub_agg using a small fake subtheme aggregation
+# - Check that capping examples keeps dimension stats intact
+# - Check that sharded (multi-process) aggregation matches a single pass
+# - Check the opt-in JSON aggregation checkpoint round-trips and is off by default
+# - Check a raising label worker stops the queued labels and surfaces the error
+# - Check --overwrite selects exact labels/slugs and substrings only via wildcards
 # - Run subthe_dimen_sr.main end-to-end with fake LLM client and check JSON outputs
 #
 # Usage:
@@ -92,6 +97,138 @@ def test_aggregate_dimensions_from_sub_agg_basic():
     assert item["sentiment_counts"]["negative"] == 1
     assert len(item["examples"]) == 2
     assert item["avg_confidence"] == (0.9 + 0.7) / 2
+    # Dimension examples keep their own shape (no per-example "dimension" key).
+    assert set(item["examples"][0]) == {
+        "subtheme", "sentiment", "confidence", "created_time",
+        "source", "evidence", "content",
+    }
+
+
+def test_aggregate_by_subtheme_caps_examples_keeps_dimension_stats():
+    # Capping examples must not change dimension-level stats, and each
+    # (subtheme, dimension) pair keeps its first N examples.
+    df = pd.DataFrame(
+        {
+            "content": [f"post {i}" for i in range(6)],
+            "text": [""] * 6,
+            "dimensions": ["A", "A", "A", "B", "B", "A"],
+            "subthemes": ["S"] * 6,
+            "subs_sentiment": ['{"S": "positive"}', '{"S": "negative"}'] * 3,
+            "confidence": [0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
+            "subs_evidences": [""] * 6,
+            "author": ["u"] * 6,
+            "source": ["reddit"] * 6,
+            "created_time": ["2024-01-01"] * 6,
+        }
+    )
+
+    full = subthe_dimen_sr.aggregate_by_subtheme(df)
+    capped = subthe_dimen_sr.aggregate_by_subtheme(df, max_examples=1)
+
+    assert [ex["content"] for ex in capped["S"]["examples"]] == ["post 0", "post 3"]
+    assert capped["S"]["total_mentions"] == 6
+
+    dim_full = subthe_dimen_sr.aggregate_dimensions_from_sub_agg(full)
+    dim_capped = subthe_dimen_sr.aggregate_dimensions_from_sub_agg(capped)
+    for dim in ("A", "B"):
+        for key in ("total_mentions", "sentiment_counts", "avg_confidence", "subthemes_counter"):
+            assert dim_capped[dim][key] == dim_full[dim][key]
+        assert dim_capped[dim]["examples"] == dim_full[dim]["examples"][:1]
+
+
+def test_aggregate_by_subtheme_sharded_matches_single_pass(monkeypatch):
+    # Row shards aggregated in worker processes must merge to the same result.
+    import subthe_dimen_core
+
+    df = pd.DataFrame(
+        {
+            "content": [f"post {i}" for i in range(12)],
+            "text": [""] * 12,
+            "dimensions": ["A", "B", "A|B"] * 4,
+            "subthemes": ["S", "T", "S|T"] * 4,
+            "subs_sentiment": ['{"S": "positive", "T": "negative"}'] * 12,
+            "confidence": [i / 12 for i in range(12)],
+            "subs_evidences": [""] * 12,
+            "author": ["u"] * 12,
+            "source": ["reddit"] * 12,
+            "created_time": ["2024-01-01"] * 12,
+        }
+    )
+
+    single = subthe_dimen_core.aggregate_by_subtheme(df, max_examples=2)
+    monkeypatch.setattr(subthe_dimen_core, "AGG_POOL_MIN_ROWS", 1)
+    monkeypatch.setattr(subthe_dimen_core.os, "cpu_count", lambda: 3)
+    sharded = subthe_dimen_core.aggregate_by_subtheme(df, max_examples=2)
+
+    assert sharded == single
+
+
+def test_load_sub_agg_checkpoint_is_opt_in_and_round_trips(tmp_path, monkeypatch):
+    import subthe_dimen_core
+
+    csv_path = tmp_path / "comments.csv"
+    pd.DataFrame(
+        {
+            "content": ["post 0", "post 1"],
+            "dimensions": ["A", "B"],
+            "subthemes": ["S", "S|T"],
+            "subs_sentiment": ['{"S": "positive", "T": "negative"}'] * 2,
+            "confidence": [0.5, 0.7],
+        }
+    ).to_csv(csv_path, index=False)
+
+    monkeypatch.delenv("SUBTHE_AGG_CACHE", raising=False)
+    n_rows, plain = subthe_dimen_core._load_sub_agg(csv_path, 2, tmp_path)
+    assert n_rows == 2
+    assert not list(tmp_path.glob(".agg_cache_*"))  # off by default
+
+    monkeypatch.setenv("SUBTHE_AGG_CACHE", "1")
+    assert subthe_dimen_core._load_sub_agg(csv_path, 2, tmp_path) == (2, plain)
+    assert [p.suffix for p in tmp_path.glob(".agg_cache_*")] == [".json"]
+
+    # second run is served from the checkpoint without reading the CSV
+    def no_load(_path):
+        raise AssertionError("checkpoint should be reused")
+
+    monkeypatch.setattr(subthe_dimen_core, "load_df", no_load)
+    assert subthe_dimen_core._load_sub_agg(csv_path, 2, tmp_path) == (2, plain)
+
+
+def test_run_labels_stops_queued_labels_when_a_worker_raises():
+    # A worker error must cancel the queued labels (no further LLM calls) and propagate.
+    import time
+    import pytest
+    import subthe_dimen_core
+
+    ran = []
+
+    def worker(idx, label):
+        ran.append(label)
+        if idx == 2:
+            raise OSError("disk full")
+        time.sleep(0.01)
+        return True
+
+    labels = [f"L{i}" for i in range(1, 21)]
+    with pytest.raises(OSError):
+        subthe_dimen_core._run_labels(labels, worker, workers=2)
+    assert len(ran) <= 4
+
+
+def test_overwrite_rule_exact_by_default_wildcard_on_request():
+    import subthe_dimen_core
+
+    rule = subthe_dimen_core.overwrite_rule("Accountability, digital_transformation")
+    assert rule("Accountability")
+    assert rule("Digital Transformation")
+    assert not rule("Accountability & Ethics")  # no substring match without a wildcard
+
+    rule = subthe_dimen_core.overwrite_rule("*digital*")
+    assert rule("Digital Transformation") and rule("Process Digitalisation")
+    assert not rule("Accountability")
+
+    assert subthe_dimen_core.overwrite_rule("all")("Anything")
+    assert not subthe_dimen_core.overwrite_rule("none")("Anything")
 
 
 def test_subthe_dimen_main_creates_files(tmp_path, monkeypatch):
@@ -131,8 +268,11 @@ def test_subthe_dimen_main_creates_files(tmp_path, monkeypatch):
     def fake_build_client():
         return None
 
-    def fake_call_deepseek_json(client, model, prompt):
+    caps = []
+
+    def fake_call_deepseek_json(client, model, prompt, max_tokens=None):
         # Return a very small dict; real shape is not important for this smoke test.
+        caps.append(max_tokens)
         return {"ok": True, "model": model}
 
     monkeypatch.setattr(subthe_dimen_sr, "build_client", fake_build_client)
@@ -178,3 +318,8 @@ def test_subthe_dimen_main_creates_files(tmp_path, monkeypatch):
     assert isinstance(sub_data, dict)
     dim_data = json.loads(dim_files[0].read_text(encoding="utf-8"))
     assert isinstance(dim_data, dict)
+
+    # per-kind output caps: subtheme, then dimension
+    import subthe_dimen_core
+
+    assert caps == [subthe_dimen_core.SUB_MAX_TOKENS, subthe_dimen_core.DIM_MAX_TOKENS]
@@ -1,9 +1,10 @@
 # Test for subtheme_classify_cluster.main()
 # Features:
 # - Fake sentence_transformers module (SentenceTransformer, CrossEncoder, util.cos_sim)
-# - Patch model loading, mapping, and clustering functions
-# - Run subtheme_classify_cluster.main() end-to-end on a small CSV
+# - Patch model loading, batched mapping, and clustering functions
+# - Run subtheme_classify_cluster.main() end-to-end on a small CSV (--backend passed to load_models)
 # - Check that dimension_clusters.json is created and has valid structure
+# - Cross-encoder pairs are length-sorted for predict and scores restored to input order
 #
 # Usage:
 #   pytest tests/test_subtheme_classify_cluster.py -q
@@ -79,8 +80,11 @@ def test_subtheme_classify_cluster_main_creates_clusters_json(tmp_path, monkeypa
     df_sub.to_csv(csv_in, index=False, encoding="utf-8-sig")
 
     # ---------- Fake load_models ----------
-    def fake_load_models():
+    backends = []
+
+    def fake_load_models(backend="torch"):
         # Return dummy objects for encoders and cross-encoder
+        backends.append(backend)
         encode1 = object()
         encode2 = object()
         dim_emb1 = object()
@@ -90,7 +94,7 @@ def test_subtheme_classify_cluster_main_creates_clusters_json(tmp_path, monkeypa
 
     monkeypatch.setattr(subtheme_classify_cluster, "load_models", fake_load_models, raising=False)
 
-    # ---------- Fake map_one ----------
+    # ---------- Fake map_many ----------
     def fake_map_one(text, encode1, encode2, dim_emb1, dim_emb2, cr):
         # Simple keyword-based mapping for test
         text = (text or "").lower()
@@ -102,7 +106,10 @@ def test_subtheme_classify_cluster_main_creates_clusters_json(tmp_path, monkeypa
             return ["Customer Orientation"]
         return ["Agility"]
 
-    monkeypatch.setattr(subtheme_classify_cluster, "map_one", fake_map_one, raising=False)
+    def fake_map_many(texts, encode1, encode2, dim_emb1, dim_emb2, cr):
+        return [fake_map_one(t, encode1, encode2, dim_emb1, dim_emb2, cr) for t in texts]
+
+    monkeypatch.setattr(subtheme_classify_cluster, "map_many", fake_map_many, raising=False)
 
     # ---------- Fake cluster_within_dimensions ----------
     def fake_cluster_within_dimensions(mapped_rows, encode1, encode2, dim_emb1, dim_emb2, max_k=10):
@@ -140,11 +147,12 @@ def test_subtheme_classify_cluster_main_creates_clusters_json(tmp_path, monkeypa
     monkeypatch.setattr(
         sys,
         "argv",
-        ["subtheme_classify_cluster.py", str(csv_in)],
+        ["subtheme_classify_cluster.py", str(csv_in), "--backend", "onnx"],
         raising=False,
     )
 
     subtheme_classify_cluster.main()
+    assert backends == ["onnx"]
 
     # ---------- Check output JSON ----------
     out_json = csv_in.parent / "dimension_clusters.json"
@@ -165,3 +173,57 @@ def test_subtheme_classify_cluster_main_creates_clusters_json(tmp_path, monkeypa
             assert "members" in c
             assert isinstance(c["members"], list)
             assert c["representative"] in c["members"]
+
+
+def test_bi_sims_encodes_each_text_once():
+    # Reload with the real sentence_transformers (the test above injects a fake one)
+    import torch
+    import subtheme_classify_cluster
+    importlib.reload(subtheme_classify_cluster)
+
+    seen = []
+
+    def encode(texts):
+        seen.extend(texts)
+        return torch.nn.functional.normalize(torch.ones(len(texts), 4), dim=1)
+
+    dim_emb = torch.nn.functional.normalize(torch.ones(len(subtheme_classify_cluster.DIM_KEYS), 4), dim=1)
+
+    sims = subtheme_classify_cluster.bi_sims(["a", "b", "a"], encode, encode, dim_emb, dim_emb)
+    assert sims.shape == (3, len(subtheme_classify_cluster.DIM_KEYS))
+    assert np.allclose(sims[0], sims[2])
+
+    # second call (e.g. clustering) reuses the cached rows
+    subtheme_classify_cluster.bi_sims(["b", "a"], encode, encode, dim_emb, dim_emb)
+    assert seen == ["a", "b", "a", "b"]  # one call per encoder, distinct texts only
+
+
+def test_retrieval_mask_matches_threshold_and_top_m():
+    import subtheme_classify_cluster as scc
+
+    rng = np.random.default_rng(0)
+    sims_all = rng.random((5, len(scc.DIM_KEYS)))
+    mask = scc.retrieval_mask(sims_all)
+    for sims, row in zip(sims_all, mask):
+        expected = set(np.where(sims >= scc.BI_SIM_TH)[0]) | set(np.argsort(-sims)[: scc.BI_TOP_M])
+        assert set(np.flatnonzero(row)) == expected
+
+
+def test_cr_pos_prob_sorts_pairs_by_length_and_restores_order():
+    import subtheme_classify_cluster as scc
+
+    class FakeCE:
+        def __init__(self):
+            self.seen = None
+
+        def predict(self, pairs, apply_softmax=True, batch_size=32):
+            self.seen = list(pairs)
+            # positive prob encodes the pair so the output order can be checked
+            pos = np.array([len(a) / 100.0 for a, _ in pairs], dtype="float32")
+            return np.stack([1 - pos, pos], axis=1)
+
+    pairs = [("a", "x"), ("aaaa", "x"), ("aa", "x")]
+    ce = FakeCE()
+    probs = scc.cr_pos_prob(ce, pairs)
+    assert [a for a, _ in ce.seen] == ["aaaa", "aa", "a"]
+    assert np.allclose(probs, [0.01, 0.04, 0.02])
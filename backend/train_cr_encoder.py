@@ -80,7 +80,7 @@ with torch.no_grad():
 
 # ==================== Cross-Encoder Base & Templates ====================
 # CE is binary: "is this subtheme about this dimension?" → yes/no
-CE_BASE   = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+CE_BASE   = os.getenv("CE_BASE_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
 CE_EPOCHS = 3
 CE_BATCH  = 16
 CE_LR     = 2e-5
@@ -376,7 +376,12 @@ def evaluate_multilabel(gold_sets, pred_sets):
     }
 
 # ==================== Main ====================
-def main():
+def main(argv=None):
+    # argv: optional [subthemes.csv, gold.csv]; overrides the globals (used by pipeline.py)
+    global CSV_SUBTHEMES, CSV_GOLD
+    if argv:
+        CSV_SUBTHEMES = Path(argv[0]).resolve()
+        CSV_GOLD      = Path(argv[1]).resolve()
     if CSV_SUBTHEMES is None or CSV_GOLD is None:
         raise RuntimeError("CSV_SUBTHEMES and CSV_GOLD must be set before calling main().")
     
@@ -386,7 +391,12 @@ def main():
     cr = train_cross_encoder(df_train, df_val)
 
     # 2) Read subthemes.csv (single required column: sub_theme).
-    sub_df = pd.read_csv(CSV_SUBTHEMES, encoding="utf-8-sig")
+    #    Use the fresh subthemes.parquet sidecar from data_process.py if there is one.
+    sub_parq = CSV_SUBTHEMES.with_suffix(".parquet")
+    if sub_parq.exists() and sub_parq.stat().st_mtime >= CSV_SUBTHEMES.stat().st_mtime:
+        sub_df = pd.read_parquet(sub_parq, columns=["sub_theme"])
+    else:
+        sub_df = pd.read_csv(CSV_SUBTHEMES, encoding="utf-8-sig")
     if "sub_theme" not in sub_df.columns:
         raise RuntimeError("[SUBTHEMES] required column: sub_theme")
 
@@ -1,8 +1,10 @@
+import csv
 import json
 import re
 import sqlite3
 from functools import lru_cache
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from flask import abort
 from werkzeug.security import check_password_hash, generate_password_hash
@@ -44,14 +46,21 @@ def _normalize_parent_id(pid: str) -> str:
 
 def _to_ymd_series(s: pd.Series) -> pd.Series:
     ts = pd.to_datetime(s, errors="coerce", utc=False, format="mixed")
-    out = ts.dt.strftime("%Y-%m-%d")
-    return out.where(~ts.isna(), s.astype(str))
+    if getattr(ts.dt, "tz", None) is not None:
+        ts = ts.dt.tz_localize(None)  # keep local wall-clock dates
+    # datetime64[D] -> "YYYY-MM-DD" is one NumPy cast instead of per-element strftime
+    out = ts.to_numpy("datetime64[D]").astype(str)
+    out = np.where(ts.isna().to_numpy(), s.astype(str).to_numpy(dtype=object), out.astype(object))
+    return pd.Series(out, index=s.index)
+
+_SLUG_SEP_RE = re.compile(r"[\s\-]+")
+_EMAIL_RE = re.compile(r"^[^\s@]+@[^\s@]+\.[^\s@]+$")
 
 def _slugify(name: str) -> str:
-    return re.sub(r"[\s\-]+", "_", name.strip().lower())
+    return _SLUG_SEP_RE.sub("_", name.strip().lower())
 
 def _is_valid_email(email: str) -> bool:
-    return bool(re.match(r"^[^\s@]+@[^\s@]+\.[^\s@]+$", email))
+    return bool(_EMAIL_RE.match(email))
 
 # ---------- IO helpers ----------
 def _read_sql(db_path: Path, sql: str, params: tuple | list = ()):
@@ -61,9 +70,38 @@ def _read_sql(db_path: Path, sql: str, params: tuple | list = ()):
         conn.row_factory = sqlite3.Row
         return pd.read_sql_query(sql, conn, params=params)
 
+_CSV_PEEK_BYTES = 4096
+
+def _sniff_encoding(head: bytes, fallback: str = "gb18030") -> str:
+    # Pick one encoding from the leading bytes instead of trial-parsing the file.
+    if head.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # a multi-byte char cut off by the peek window is still utf-8
+        if e.reason != "unexpected end of data":
+            return fallback
+    return "utf-8"
+
+def _sniff_csv(path: Path) -> tuple[str, str]:
+    # (encoding, delimiter) from the first few KB; delimiter from the header line
+    # like pandas' python engine does with sep=None.
+    with open(path, "rb") as f:
+        head = f.read(_CSV_PEEK_BYTES)
+    enc = _sniff_encoding(head)
+    text = head.decode(enc, errors="ignore")
+    first = text.splitlines()[0] if text else ""
+    return enc, csv.Sniffer().sniff(first).delimiter
+
 def _read_csv_safe(path: Path) -> pd.DataFrame:
     if not path or not path.exists():
         abort(404, description=f"{path} not found")
+    try:
+        enc, sep = _sniff_csv(path)
+        return pd.read_csv(path, sep=sep, engine="c", encoding=enc, on_bad_lines="skip")
+    except Exception:
+        pass  # fall through to the slow trial loop
     tried = []
     for enc in [None, "utf-8", "utf-8-sig", "gb18030", "gbk", "latin1"]:
         try: